@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import logging
+import requests
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Правила оповещений (0 — правило отключено)
+ALERT_LEFT_PERCENT = float(os.getenv('ALERT_LEFT_PERCENT', '10'))  # осталось меньше этой доли лимита, %
+ALERT_LEFT_MIN = int(os.getenv('ALERT_LEFT_MIN', '0'))  # осталось меньше этого числа просмотров
+# Куда отправлять оповещения, через запятую: log, file:<путь>, webhook:<url>
+ALERT_SINKS = os.getenv('ALERT_SINKS', 'log')
+ALERT_WEBHOOK_TIMEOUT = float(os.getenv('ALERT_WEBHOOK_TIMEOUT', '5'))
+
+ALERTS = metrics.Counter(
+    'hh_alerts_total',
+    'Оповещения о лимитах: triggered — порог нарушен, resolved — снова в норме',
+    ('rule', 'event')
+)
+
+
+# Правило: остаток меньше доли лимита (в процентах)
+class LeftPercentRule:
+    name = 'left_percent'
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+
+    def breached(self, summary):
+        return summary.get('percent_left') is not None and summary['percent_left'] < self.threshold
+
+    def describe(self, summary):
+        return f"осталось {summary['left']} из {summary['limit']} просмотров ({summary['percent_left']}%), порог {self.threshold:g}%"
+
+
+# Правило: остаток меньше заданного числа просмотров
+class LeftMinRule:
+    name = 'left_min'
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+
+    def breached(self, summary):
+        return summary.get('left') is not None and summary['left'] < self.threshold
+
+    def describe(self, summary):
+        return f"осталось {summary['left']} просмотров, порог {self.threshold}"
+
+
+# Правила из настроек окружения
+def default_rules():
+    rules = []
+    if ALERT_LEFT_PERCENT > 0:
+        rules.append(LeftPercentRule(ALERT_LEFT_PERCENT))
+    if ALERT_LEFT_MIN > 0:
+        rules.append(LeftMinRule(ALERT_LEFT_MIN))
+    return rules
+
+
+# Запись оповещений в лог
+class LogSink:
+    def send(self, events):
+        for event in events:
+            log = logger.warning if event['event'] == 'triggered' else logger.info
+            log("Оповещение %s (%s): %s (ID: %s): %s", event['event'], event['rule'],
+                event['manager_name'], event['manager_id'], event['message'])
+
+
+# Дописывание оповещений в файл NDJSON (одна строка JSON на оповещение)
+class FileSink:
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, events):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+
+# Отправка оповещений одного обхода одним POST-запросом JSON {"alerts": [...]}.
+# Запрос идет напрямую, а не через hh_client: ограничитель частоты относится только к HH.ru.
+class WebhookSink:
+    def __init__(self, url, timeout=ALERT_WEBHOOK_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, events):
+        response = requests.post(self.url, json={'alerts': events}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+# Типы получателей для ALERT_SINKS; register_sink добавляет новый тип
+SINK_TYPES = {
+    'log': lambda target: LogSink(),
+    'file': FileSink,
+    'webhook': WebhookSink
+}
+
+
+def register_sink(kind, factory):
+    SINK_TYPES[kind] = factory
+
+
+# Разбор ALERT_SINKS: 'log,file:data/alerts.ndjson,webhook:https://example.com/hook'
+def create_sinks(spec=ALERT_SINKS):
+    sinks = []
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        kind, _, target = entry.partition(':')
+        factory = SINK_TYPES.get(kind)
+        if factory is None:
+            raise ValueError(f'Неизвестный получатель оповещений: {kind}')
+        sinks.append(factory(target))
+    return sinks
+
+
+# Проверка правил по изменениям одного снимка (SnapshotStore.record_snapshot).
+# Проверяются только менеджеры, у которых изменились лимиты, поэтому обход
+# всех менеджеров работодателя не нужен. Оповещение отправляется при переходе
+# через порог: triggered — порог нарушен, resolved — снова в норме (например,
+# после сброса лимитов).
+class Alerter:
+    def __init__(self, rules=None, sinks=None):
+        self.rules = default_rules() if rules is None else rules
+        self.sinks = create_sinks() if sinks is None else sinks
+
+    def evaluate(self, employer_id, changes, taken_at=None):
+        taken_at = taken_at or time.time()
+        events = []
+        for change in changes:
+            previous, current = change['previous'], change['current']
+            for rule in self.rules:
+                was = previous is not None and rule.breached(previous)
+                now = rule.breached(current)
+                if was == now:
+                    continue
+                events.append({
+                    'event': 'triggered' if now else 'resolved',
+                    'rule': rule.name,
+                    'employer_id': str(employer_id),
+                    'manager_id': change['manager_id'],
+                    'manager_name': change['manager_name'],
+                    'limit': current['limit'],
+                    'spend': current['spend'],
+                    'left': current['left'],
+                    'percent_used': current['percent_used'],
+                    'resets_at': current['resets_at'],
+                    'taken_at': taken_at,
+                    'message': rule.describe(current)
+                })
+        return events
+
+    # Проверка правил и отправка оповещений. Ошибка одного получателя
+    # записывается в лог и не мешает остальным и сборщику.
+    def process(self, employer_id, changes, taken_at=None):
+        events = self.evaluate(employer_id, changes, taken_at)
+        if not events:
+            return events
+        for event in events:
+            ALERTS.inc(rule=event['rule'], event=event['event'])
+        for sink in self.sinks:
+            try:
+                sink.send(events)
+            except Exception as e:
+                logger.error("Не удалось отправить оповещения (%s): %s", type(sink).__name__, e)
+        return events
@@ -0,0 +1,125 @@
+import os
+import time
+import numpy as np
+from summaries import period_end
+
+# За сколько дней истории строится прогноз
+FORECAST_HISTORY_DAYS = int(os.getenv('FORECAST_HISTORY_DAYS', '31'))
+
+# Скорость расхода меньше этой (просмотров в сутки) считается нулевой: регрессия
+# по неизменному spend дает не ровно 0, а погрешность вычислений
+FORECAST_MIN_RATE = float(os.getenv('FORECAST_MIN_RATE', '0.001'))
+# Исчерпание позже этого срока (дни) не прогнозируется: exhaust_at = None
+FORECAST_HORIZON_DAYS = int(os.getenv('FORECAST_HORIZON_DAYS', '366'))
+
+SECONDS_PER_DAY = 86400.0
+
+
+# Прогноз расхода просмотров резюме по истории снимков.
+# rows — результат SnapshotStore.history(): (manager_id, manager_name, taken_at,
+# limit, spend, left), отсортированные по менеджеру и времени.
+# Для каждого менеджера берется участок после последнего сброса счетчика
+# (spend уменьшился), скорость расхода — наклон линейной регрессии spend(t)
+# в просмотрах в сутки. Все менеджеры считаются одновременно, без циклов по строкам.
+def compute_forecast(rows, now=None):
+    now = now or time.time()
+    deadline = period_end(now)
+    if not rows:
+        return [], _aggregate([], now, deadline)
+
+    manager_ids = np.array([row[0] for row in rows])
+    taken_at = np.array([row[2] for row in rows], dtype=float)
+    limit = np.array([np.nan if row[3] is None else row[3] for row in rows], dtype=float)
+    spend = np.array([row[4] for row in rows], dtype=float)
+    left = np.array([np.nan if row[5] is None else row[5] for row in rows], dtype=float)
+    n = len(rows)
+
+    # Границы менеджеров и сбросы счетчика внутри истории менеджера
+    new_manager = np.ones(n, dtype=bool)
+    new_manager[1:] = manager_ids[1:] != manager_ids[:-1]
+    reset = np.zeros(n, dtype=bool)
+    reset[1:] = ~new_manager[1:] & (spend[1:] < spend[:-1])
+    manager_index = np.cumsum(new_manager) - 1
+    segment = np.cumsum(new_manager | reset)
+    manager_count = manager_index[-1] + 1
+
+    # Используется только последний участок (текущий период) каждого менеджера
+    starts = np.flatnonzero(new_manager)
+    last_segment = np.maximum.reduceat(segment, starts)
+    current = segment == last_segment[manager_index]
+
+    # Сгруппированная линейная регрессия spend = a + rate * days
+    group = manager_index[current]
+    x = (taken_at[current] - now) / SECONDS_PER_DAY
+    y = spend[current]
+    count = np.bincount(group, minlength=manager_count).astype(float)
+    sum_x = np.bincount(group, x, manager_count)
+    sum_y = np.bincount(group, y, manager_count)
+    sum_xx = np.bincount(group, x * x, manager_count)
+    sum_xy = np.bincount(group, x * y, manager_count)
+    denominator = count * sum_xx - sum_x ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = np.where(denominator > 1e-12, (count * sum_xy - sum_x * sum_y) / denominator, 0.0)
+    rate = np.where(rate < FORECAST_MIN_RATE, 0.0, rate)
+
+    # Последние значения каждого менеджера
+    last = np.append(starts[1:], n) - 1
+    last_taken = taken_at[last]
+    last_spend = spend[last]
+    last_limit = limit[last]
+    last_left = np.where(np.isnan(left[last]), last_limit - last_spend, left[last])
+
+    # Исчерпанный лимит (left == 0) — уже исчерпан независимо от скорости
+    exhausted = last_left <= 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_left = np.where(exhausted, 0.0, np.where(rate > 0, last_left / rate, np.inf))
+    exhaust_at = last_taken + days_left * SECONDS_PER_DAY
+    exhaust_at = np.where(exhaust_at > now + FORECAST_HORIZON_DAYS * SECONDS_PER_DAY, np.inf, exhaust_at)
+    at_risk = exhausted | (exhaust_at < deadline)
+
+    forecast = []
+    for i in np.argsort(exhaust_at, kind='stable'):
+        row = rows[last[i]]
+        forecast.append({
+            'manager_id': row[0],
+            'manager_name': row[1],
+            'taken_at': float(last_taken[i]),
+            'limit': None if np.isnan(last_limit[i]) else int(last_limit[i]),
+            'spend': int(last_spend[i]),
+            'left': None if np.isnan(last_left[i]) else int(last_left[i]),
+            'rate_per_day': float(rate[i]),
+            'exhaust_at': float(exhaust_at[i]) if np.isfinite(exhaust_at[i]) else None,
+            'exhausted': bool(exhausted[i]),
+            'at_risk': bool(at_risk[i])
+        })
+    return forecast, _aggregate(forecast, now, deadline)
+
+
+# Сводные показатели по работодателю
+def _aggregate(forecast, now, deadline):
+    total_left = sum(item['left'] or 0 for item in forecast)
+    total_rate = sum(item['rate_per_day'] for item in forecast)
+    if forecast and total_left <= 0:
+        exhaust_at = now
+    elif total_rate > 0 and total_left / total_rate <= FORECAST_HORIZON_DAYS:
+        exhaust_at = now + total_left / total_rate * SECONDS_PER_DAY
+    else:
+        exhaust_at = None
+    return {
+        'managers': len(forecast),
+        'total_limit': sum(item['limit'] or 0 for item in forecast),
+        'total_spend': sum(item['spend'] for item in forecast),
+        'total_left': total_left,
+        'total_rate_per_day': total_rate,
+        'exhaust_at': exhaust_at,
+        'at_risk': sum(1 for item in forecast if item['at_risk']),
+        'period_end': deadline
+    }
+
+
+# Прогноз по данным хранилища снимков за последние FORECAST_HISTORY_DAYS дней
+# (manager_ids — только по этим менеджерам, например доступным пользователю)
+def forecast_for_employer(store, employer_id, now=None, history_days=FORECAST_HISTORY_DAYS, manager_ids=None):
+    now = now or time.time()
+    rows = store.history(employer_id, since=now - history_days * SECONDS_PER_DAY)
+    return compute_forecast([tuple(row) for row in rows if manager_ids is None or row[0] in manager_ids], now)
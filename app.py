@@ -1,133 +1,222 @@
 import requests
 import os
 import re
+import time
 import logging
+import hashlib
 from dotenv import load_dotenv
-from datetime import datetime, timedelta, timezone
-from flask import Flask, redirect, url_for, session, request, render_template, flash
-import json
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+from datetime import datetime
 
-app = Flask(__name__)
+# Модули проекта читают настройки из окружения при импорте, поэтому .env
+# загружается до них (уже заданные переменные окружения не перезаписываются)
 load_dotenv()
 
-# Настройки из .env
-CLIENT_ID = os.getenv('CLIENT_ID')
-CLIENT_SECRET = os.getenv('CLIENT_SECRET')
-REDIRECT_URI = os.getenv('REDIRECT_URI')
-SECRET_KEY = os.getenv('SECRET_KEY')
-USER_AGENT = os.getenv('USER_AGENT', 'HH Limits/1.0')
-
-# Константы
-REQUEST_TIMEOUT = 10  # секунды
+from flask import Flask, Blueprint, Response, abort, current_app, redirect, url_for, session, request, render_template, flash, stream_with_context, g, make_response
+from flask import before_render_template, template_rendered
+import json
+from functools import partial
+from fetcher import fetch_all_limits, iter_limits, NO_DATA_MESSAGE
+from managers import ManagerDirectory, ManagerSyncError
+from export import FORMATS as EXPORT_FORMATS, stream_records, make_record, format_ndjson
+import hh_client
+import metrics
+import logging_setup
+from hh_client import API_URL, OAUTH_URL, REQUEST_TIMEOUT
+from tokens import TokenManager, parse_expires_at
+from session_store import create_session_store, regenerate_session, ServerSideSessionInterface
+from snapshots import open_existing_store, SNAPSHOT_MAX_AGE, SNAPSHOT_CACHE_MAX_AGE
+from compression import compress_response, matching_etag
+from cache import TTLCache, StaleWhileRevalidateCache, IDENTITY_CACHE_TTL, LIMITS_FRESH_TTL, LIMITS_STALE_TTL, LIMITS_LAST_KNOWN_TTL, token_key
+from breaker import CircuitOpenError
 
-app.secret_key = SECRET_KEY
-app.config['JSON_AS_ASCII'] = False
-app.config['SESSION_COOKIE_HTTPONLY'] = True  # Защита от XSS
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # CSRF защита
+logger = logging.getLogger(__name__)
 
-# Проверка наличия обязательных настроек
-if not all([CLIENT_ID, CLIENT_SECRET, REDIRECT_URI, SECRET_KEY]):
-    logger.error("Отсутствуют обязательные переменные окружения")
-    raise Exception("Пожалуйста, убедитесь, что все обязательные переменные заданы в файле .env")
+# Маршруты веб-интерфейса. Приложение создается в create_app(): импорт модуля
+# не настраивает логирование и не открывает хранилище сессий.
+bp = Blueprint('main', __name__)
+
+# Кеши ответов /me (по токену) и информации о менеджерах
+user_info_cache = TTLCache('user_info', IDENTITY_CACHE_TTL)
+manager_info_cache = TTLCache('manager_info', IDENTITY_CACHE_TTL)
+# Менеджеры, которых HH.ru показывает пользователю (по токену): кеш лимитов
+# и снимки сборщика общие для работодателя, поэтому отдаются только по ним
+manager_access_cache = TTLCache('manager_access', IDENTITY_CACHE_TTL)
+# Кеш лимитов просмотра резюме (stale-while-revalidate). Последние известные
+# лимиты хранятся до LIMITS_LAST_KNOWN_TTL на случай недоступности HH.ru
+limits_cache = StaleWhileRevalidateCache('resume_limits', LIMITS_FRESH_TTL, LIMITS_STALE_TTL, keep_ttl=LIMITS_LAST_KNOWN_TTL)
+
+# Замер длительности обработки запросов и числа одновременных запросов воркера,
+# идентификатор запроса для записей лога (заголовок X-Request-ID) и общий срок
+# запросов к HH.ru (hh_client.REQUEST_BUDGET)
+@bp.before_app_request
+def start_request_timer():
+    g.request_id_token, g.request_id = logging_setup.bind_request_id(request.headers.get('X-Request-ID'))
+    g.hh_deadline_token = hh_client.start_deadline()
+    g.request_started = time.perf_counter()
+    metrics.HTTP_IN_PROGRESS.inc()
+
+@bp.after_app_request
+def observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        metrics.HTTP_IN_PROGRESS.dec()
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - started, method=request.method,
+                                     endpoint=request.endpoint or 'unknown', status=response.status_code)
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+# Политики кеширования ответов (заголовок Cache-Control). Ответы по снимку сборщика
+# браузер показывает повторно без запроса; остальные ответы зависят от пользователя
+# и каждый раз проверяются на сервере, nginx кеширует только public.
+SNAPSHOT_CACHE_CONTROL = f'private, max-age={SNAPSHOT_CACHE_MAX_AGE}'
+LIVE_CACHE_CONTROL = 'private, no-cache'
+PUBLIC_CACHE_CONTROL = 'public, max-age=300'
+
+@bp.after_app_request
+def set_cache_control(response):
+    if 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = LIVE_CACHE_CONTROL
+    # Потоковые ответы nginx передает клиенту без буферизации
+    if response.is_streamed:
+        response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.teardown_app_request
+def finish_request(error=None):
+    # Необработанное исключение: after_request не вызывался
+    if g.pop('request_started', None) is not None:
+        metrics.HTTP_IN_PROGRESS.dec()
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        logging_setup.reset_request_id(token)
+    deadline_token = g.pop('hh_deadline_token', None)
+    if deadline_token is not None:
+        hh_client.end_deadline(deadline_token)
+
+# Замер времени отрисовки шаблонов
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+def observe_render(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        metrics.RENDER_LATENCY.observe(time.perf_counter() - started, template=template.name)
+
+# Запрос пришел напрямую с этого сервера, а не через nginx (он добавляет X-Forwarded-For)
+def is_local_request():
+    if request.remote_addr not in ('127.0.0.1', '::1'):
+        return False
+    return 'X-Forwarded-For' not in request.headers and 'X-Real-IP' not in request.headers
+
+# Метрики в формате Prometheus. Если задан METRICS_TOKEN, нужен заголовок
+# Authorization: Bearer <токен>; без токена страница доступна только с этого
+# сервера, если не разрешен общий доступ (METRICS_PUBLIC=1)
+@bp.route('/metrics')
+def metrics_endpoint():
+    if not metrics.METRICS_ENABLED:
+        abort(404)
+    if metrics.METRICS_TOKEN:
+        if request.headers.get('Authorization') != f'Bearer {metrics.METRICS_TOKEN}':
+            abort(401)
+    elif not metrics.METRICS_PUBLIC and not is_local_request():
+        abort(403)
+    response = Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 # Главная страница с кнопкой авторизации
-@app.route('/')
+@bp.route('/')
 def index():
-    return render_template('index.html')
+    response = make_response(render_template('index.html'))
+    # Без cookie сессии страница одинакова для всех: ее может кешировать nginx
+    if current_app.config['SESSION_COOKIE_NAME'] not in request.cookies:
+        response.headers['Cache-Control'] = PUBLIC_CACHE_CONTROL
+    return response
 
 # Перенаправление на страницу авторизации HH.ru
-@app.route('/login')
+@bp.route('/login')
 def login():
     auth_url = (
-        f"https://hh.ru/oauth/authorize?"
-        f"response_type=code&client_id={CLIENT_ID}&redirect_uri={REDIRECT_URI}&scope=employer"
+        f"{OAUTH_URL}/oauth/authorize?"
+        f"response_type=code&client_id={current_app.config['HH_CLIENT_ID']}&redirect_uri={current_app.config['HH_REDIRECT_URI']}&scope=employer"
     )
     return redirect(auth_url)
 
 # Обработка обратного вызова от HH.ru
-@app.route('/callback')
+@bp.route('/callback')
 def callback():
     error = request.args.get('error')
     if error:
         flash(f"Ошибка авторизации: {error}", "danger")
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     code = request.args.get('code')
     if not code:
         flash("Отсутствует параметр 'code' в запросе", "danger")
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     # Валидация кода (только буквы и цифры)
     if not re.match(r'^[A-Za-z0-9_-]+$', code):
-        logger.warning(f"Некорректный формат кода авторизации: {code[:10]}...")
+        logger.warning("Некорректный формат кода авторизации: %s...", code[:10])
         flash("Некорректный формат кода авторизации", "danger")
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     # Обмен кода на токен
-    token_url = 'https://hh.ru/oauth/token'
+    token_url = f'{OAUTH_URL}/oauth/token'
     token_data = {
         'grant_type': 'authorization_code',
         'code': code,
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET,
-        'redirect_uri': REDIRECT_URI
+        'client_id': current_app.config['HH_CLIENT_ID'],
+        'client_secret': current_app.config['HH_CLIENT_SECRET'],
+        'redirect_uri': current_app.config['HH_REDIRECT_URI']
     }
 
     try:
-        response = requests.post(token_url, data=token_data, timeout=REQUEST_TIMEOUT)
+        response = hh_client.post(token_url, data=token_data, timeout=REQUEST_TIMEOUT)
     except requests.Timeout:
         logger.error("Timeout при получении токена")
         flash("Превышено время ожидания ответа от HH.ru. Попробуйте снова.", "danger")
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     except requests.RequestException as e:
-        logger.error(f"Ошибка сети при получении токена: {str(e)}")
+        logger.error("Ошибка сети при получении токена: %s", e)
         flash("Ошибка соединения с HH.ru. Попробуйте позже.", "danger")
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     if response.status_code != 200:
         flash(f"Ошибка при получении токена доступа: {response.status_code}\n{response.text}", "danger")
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     token_info = response.json()
     access_token = token_info.get('access_token')
     refresh_token = token_info.get('refresh_token')
     expires_in = token_info.get('expires_in', 3600)  # По умолчанию 1 час
-    expires_at = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+    expires_at = time.time() + expires_in
 
     if not access_token or not refresh_token:
         flash("Не удалось получить access_token или refresh_token", "danger")
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
-    # Сохранение токенов в сессии
+    # Сохранение токенов в сессии под новым идентификатором
+    regenerate_session(session)
     session['access_token'] = access_token
     session['refresh_token'] = refresh_token
-    session['expires_at'] = expires_at.strftime('%Y-%m-%d %H:%M:%S')
+    session['expires_at'] = expires_at
 
     flash("Авторизация прошла успешно!", "success")
-    return redirect(url_for('limits'))
+    return redirect(url_for('main.limits'))
 
 # Функция для обновления access_token с использованием refresh_token
 def refresh_access_token(refresh_token):
-    token_url = 'https://hh.ru/oauth/token'
+    token_url = f'{OAUTH_URL}/oauth/token'
     token_data = {
         'grant_type': 'refresh_token',
         'refresh_token': refresh_token,
-        'client_id': CLIENT_ID,
-        'client_secret': CLIENT_SECRET
+        'client_id': current_app.config['HH_CLIENT_ID'],
+        'client_secret': current_app.config['HH_CLIENT_SECRET']
     }
 
     try:
-        response = requests.post(token_url, data=token_data, timeout=REQUEST_TIMEOUT)
+        response = hh_client.post(token_url, data=token_data, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
             return response.json()
         else:
@@ -136,118 +225,322 @@ def refresh_access_token(refresh_token):
         logger.error("Timeout при обновлении токена")
         raise Exception("Превышено время ожидания ответа от HH.ru")
     except requests.RequestException as e:
-        logger.error(f"Ошибка сети при обновлении токена: {str(e)}")
+        logger.error("Ошибка сети при обновлении токена: %s", e)
         raise Exception(f"Ошибка соединения с HH.ru: {str(e)}")
 
+# Сброс закешированных данных пользователя для токена
+def invalidate_user_cache(access_token):
+    if not access_token:
+        return
+    key = token_key(access_token)
+    user_info = user_info_cache.get(key)
+    if user_info:
+        employer_id = (user_info.get('employer') or {}).get('id')
+        manager_id = (user_info.get('manager') or {}).get('id')
+        manager_info_cache.invalidate(f'{employer_id}:{manager_id}')
+    user_info_cache.invalidate(key)
+    manager_access_cache.invalidate(key)
+
+# Менеджер обновления токенов (заблаговременное обновление без гонок между воркерами)
+token_manager = TokenManager(refresh_access_token)
+
 # Проверка и обновление токена
 def get_valid_access_token():
     access_token = session.get('access_token')
     refresh_token = session.get('refresh_token')
-    expires_at_str = session.get('expires_at')
+    expires_at = session.get('expires_at')
 
-    if not access_token or not refresh_token or not expires_at_str:
+    if not access_token or not refresh_token or not expires_at:
         raise Exception("Токены отсутствуют. Пожалуйста, авторизуйтесь снова.")
 
-    expires_at = datetime.strptime(expires_at_str, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-    if datetime.now(timezone.utc) >= expires_at:
-        # Токен истёк, обновляем
+    expires_at = parse_expires_at(expires_at)
+    if token_manager.needs_refresh(expires_at):
+        # Токен истёк или скоро истечёт, обновляем
         try:
-            token_info = refresh_access_token(refresh_token)
-            access_token = token_info['access_token']
-            refresh_token = token_info.get('refresh_token', refresh_token)
-            expires_in = token_info.get('expires_in', 3600)
-            expires_at = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
-
-            # Обновление сессии
-            session['access_token'] = access_token
-            session['refresh_token'] = refresh_token
-            session['expires_at'] = expires_at.strftime('%Y-%m-%d %H:%M:%S')
-
+            result = token_manager.refresh(refresh_token)
         except Exception as e:
             raise Exception(f"Не удалось обновить токен доступа: {str(e)}")
 
+        invalidate_user_cache(access_token)
+        access_token = result['access_token']
+
+        # Обновление сессии
+        session['access_token'] = access_token
+        session['refresh_token'] = result['refresh_token']
+        session['expires_at'] = result['expires_at']
+
     return access_token
 
 # Функция для получения информации о менеджере
 def get_manager_info(employer_id, manager_id, headers):
-    url = f'https://api.hh.ru/employers/{employer_id}/managers/{manager_id}'
+    cache_key = f'{employer_id}:{manager_id}'
+    manager_info = manager_info_cache.get(cache_key)
+    if manager_info is not None:
+        return manager_info
+
+    url = f'{API_URL}/employers/{employer_id}/managers/{manager_id}'
     try:
-        response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        response = hh_client.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
-            return response.json()
+            manager_info = response.json()
+            manager_info_cache.set(cache_key, manager_info)
+            return manager_info
         else:
-            logger.warning(f"Ошибка при получении информации о менеджере (ID: {manager_id}): {response.status_code}")
+            logger.warning("Ошибка при получении информации о менеджере (ID: %s): %s", manager_id, response.status_code)
             return None
     except requests.Timeout:
-        logger.error(f"Timeout при получении информации о менеджере (ID: {manager_id})")
+        logger.error("Timeout при получении информации о менеджере (ID: %s)", manager_id)
+        return None
+    except requests.RequestException as e:
+        logger.error("Ошибка сети при получении информации о менеджере: %s", e)
+        return None
+
+# Функция для получения списка менеджеров работодателя (все страницы,
+# с условными запросами и локальным справочником)
+def get_managers(employer_id, headers):
+    directory = ManagerDirectory(employer_id)
+    try:
+        managers = directory.sync(headers)
+        remember_manager_access(headers, managers)
+        return managers
+    except CircuitOpenError as e:
+        # HH.ru не отвечает: менеджеры из последней синхронизации справочника
+        logger.warning('%s', e)
+        return directory.known_items() or None
+    except ManagerSyncError as e:
+        logger.warning('%s', e)
+        return None
+    except requests.Timeout:
+        logger.error("Timeout при получении списка менеджеров (employer ID: %s)", employer_id)
         return None
     except requests.RequestException as e:
-        logger.error(f"Ошибка сети при получении информации о менеджере: {str(e)}")
+        logger.error("Ошибка сети при получении списка менеджеров: %s", e)
         return None
 
+# Ключ кеша доступа по заголовкам запроса: токен пользователя, как у кеша /me
+def access_cache_key(headers):
+    return token_key(headers['Authorization'][len('Bearer '):])
+
+# Запоминание менеджеров из списка, полученного с токеном пользователя
+def remember_manager_access(headers, managers):
+    manager_ids = sorted(str(manager['id']) for manager in managers if manager.get('id'))
+    manager_access_cache.set(access_cache_key(headers), manager_ids)
+    return manager_ids
+
+# Идентификаторы менеджеров, лимиты которых доступны пользователю: менеджеры из
+# списка, который HH.ru отдает с его токеном, и сам пользователь. Если HH.ru
+# отказал в списке (403) — только сам пользователь; если доступ проверить
+# не удалось (HH.ru не отвечает), тоже только он, без сохранения в кеш.
+def get_accessible_managers(employer_id, manager_id, headers):
+    manager_ids = manager_access_cache.get(access_cache_key(headers))
+    if manager_ids is None:
+        try:
+            manager_ids = remember_manager_access(headers, ManagerDirectory(employer_id).sync(headers))
+        except ManagerSyncError as e:
+            if e.status_code != 403:
+                logger.warning('Не удалось проверить доступ к менеджерам: %s', e)
+                manager_ids = []
+            else:
+                manager_ids = remember_manager_access(headers, [])
+        except requests.RequestException as e:
+            logger.warning('Не удалось проверить доступ к менеджерам: %s', e)
+            manager_ids = []
+    accessible = set(manager_ids)
+    if manager_id:
+        accessible.add(str(manager_id))
+    return accessible
+
+# Отпечаток набора доступных менеджеров для ETag ответов по снимку
+def access_tag(accessible):
+    return ','.join(sorted(accessible))
+
 # Функция для получения лимитов просмотра резюме для менеджера
+def resume_limits_url(employer_id, manager_id):
+    return f'{API_URL}/employers/{employer_id}/managers/{manager_id}/limits/resume'
+
 def get_resume_view_limits(employer_id, manager_id, headers, locale='RU', host='hh.ru'):
-    url = f'https://api.hh.ru/employers/{employer_id}/managers/{manager_id}/limits/resume'
+    url = resume_limits_url(employer_id, manager_id)
     params = {
         'locale': locale,
         'host': host
     }
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=REQUEST_TIMEOUT)
+        response = hh_client.get(url, headers=headers, params=params, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
             return response.json()
         elif response.status_code == 403:
-            logger.warning(f"Доступ запрещен для менеджера (ID: {manager_id})")
-            return "Нет данных или доступ запрещен."
+            logger.warning("Доступ запрещен для менеджера (ID: %s)", manager_id)
+            return NO_DATA_MESSAGE
         elif response.status_code == 404:
-            logger.warning(f"Данных нет для менеджера (ID: {manager_id})")
-            return "Нет данных или доступ запрещен."
+            logger.warning("Данных нет для менеджера (ID: %s)", manager_id)
+            return NO_DATA_MESSAGE
+        elif response.status_code == 429:
+            logger.warning("HH.ru ограничил частоту запросов при получении лимитов для менеджера (ID: %s)", manager_id)
+            return None
         else:
-            logger.error(f'Ошибка при получении лимитов для менеджера (ID: {manager_id}): {response.status_code}')
+            logger.error('Ошибка при получении лимитов для менеджера (ID: %s): %s', manager_id, response.status_code)
             return None
     except requests.Timeout:
-        logger.error(f"Timeout при получении лимитов для менеджера (ID: {manager_id})")
+        logger.error("Timeout при получении лимитов для менеджера (ID: %s)", manager_id)
+        return None
+    except requests.RequestException as e:
+        logger.error("Ошибка сети при получении лимитов: %s", e)
+        return None
+
+def limits_cache_key(employer_id, manager_id, locale='RU', host='hh.ru'):
+    return f'{employer_id}:{manager_id}:{locale}:{host}'
+
+# Лимиты просмотра резюме через кеш: свежие данные отдаются из кеша,
+# устаревшие отдаются сразу и обновляются в фоне, одновременные запросы
+# одного менеджера выполняют один запрос к HH.ru
+def get_cached_resume_view_limits(employer_id, manager_id, headers, locale='RU', host='hh.ru'):
+    return limits_cache.get_or_load(
+        limits_cache_key(employer_id, manager_id, locale, host),
+        lambda: get_resume_view_limits(employer_id, manager_id, headers, locale, host),
+        should_cache=lambda value: isinstance(value, dict)
+    )
+
+# HH.ru не отвечает на запросы лимитов работодателя (цепь разомкнута, breaker.py)
+def limits_degraded(employer_id):
+    return hh_client.circuit_open(resume_limits_url(employer_id, 0))
+
+# Последние известные лимиты менеджера любой давности: из кеша или из снимка сборщика.
+# Возвращает (лимиты, время получения) или (None, None).
+def last_known_limits(employer_id, manager_id):
+    entry = limits_cache.last_known(limits_cache_key(employer_id, manager_id))
+    if entry is not None:
+        return entry['value'], entry['fetched_at']
+    store = get_snapshot_store()
+    item = store.latest_for_manager(employer_id, manager_id) if store is not None else None
+    if item is not None:
+        return item['limits'], item['taken_at']
+    return None, None
+
+# Лимиты менеджера для страниц и API. Если HH.ru не отвечает (цепь разомкнута),
+# запрос не выполняется, а возвращаются последние известные лимиты; время их
+# получения записывается в stale[manager_id] для пометки устаревших данных.
+def get_limits_or_last_known(employer_id, manager_id, headers, stale):
+    if not limits_degraded(employer_id):
+        limits = get_cached_resume_view_limits(employer_id, manager_id, headers)
+        if limits is not None or not limits_degraded(employer_id):
+            return limits
+    limits, fetched_at = last_known_limits(employer_id, manager_id)
+    if limits is not None:
+        stale[str(manager_id)] = fetched_at
+    return limits
+
+# Получение информации о текущем пользователе (/me) с кешированием по токену.
+# При ошибке сообщает о ней через notify (по умолчанию флеш-сообщение) и возвращает None.
+def get_user_info(access_token, headers, notify=flash):
+    user_cache_key = token_key(access_token)
+    user_info = user_info_cache.get(user_cache_key)
+    if user_info is not None:
+        return user_info
+
+    user_info_url = f'{API_URL}/me'
+    try:
+        user_response = hh_client.get(user_info_url, headers=headers, timeout=REQUEST_TIMEOUT)
+    except requests.Timeout:
+        logger.error("Timeout при получении информации о пользователе")
+        notify("Превышено время ожидания ответа от HH.ru. Попробуйте позже.", "danger")
         return None
     except requests.RequestException as e:
-        logger.error(f"Ошибка сети при получении лимитов: {str(e)}")
+        logger.error("Ошибка сети при получении информации о пользователе: %s", e)
+        notify("Ошибка соединения с HH.ru. Попробуйте позже.", "danger")
+        return None
+    if user_response.status_code != 200:
+        notify(f"Ошибка при получении информации о пользователе: {user_response.status_code}\n{user_response.text}", "danger")
         return None
 
+    user_info = user_response.json()
+    # Кешируются только ответы, содержащие работодателя и менеджера
+    if (user_info.get('employer') or {}).get('id') and (user_info.get('manager') or {}).get('id'):
+        user_info_cache.set(user_cache_key, user_info)
+    return user_info
+
+# Заголовки запросов к API HH.ru
+def api_headers(access_token):
+    return {
+        'Authorization': f'Bearer {access_token}',
+        'User-Agent': current_app.config['HH_USER_AGENT'],
+        'Accept': 'application/json'
+    }
+
+# Хранилище снимков сборщика (python get.py collect); None, пока сборщик не создал базу
+_snapshot_store = None
+
+def get_snapshot_store():
+    global _snapshot_store
+    if _snapshot_store is None:
+        _snapshot_store = open_existing_store()
+    return _snapshot_store
+
+# Время снимка в виде строки для шаблона ('—' для пустого или недопустимого значения)
+def format_snapshot_time(taken_at):
+    try:
+        return datetime.fromtimestamp(taken_at).strftime('%d.%m.%Y %H:%M:%S')
+    except (TypeError, ValueError, OverflowError, OSError):
+        return '—'
+
+# Снимок показывается вместо запроса к HH.ru, если он не старше SNAPSHOT_MAX_AGE.
+# Если HH.ru не отвечает, показывается снимок любой давности с пометкой об устаревании.
+def snapshot_usable(employer_id, taken_at):
+    return bool(taken_at) and (not snapshot_stale(taken_at) or limits_degraded(employer_id))
+
+def snapshot_stale(taken_at):
+    return time.time() - taken_at >= SNAPSHOT_MAX_AGE
+
+# Сильный ETag ответа по снимку сборщика: вид ответа, работодатель и идентификатор
+# снимка. Известен до чтения лимитов, поэтому повторный запрос получает 304
+# без загрузки снимка, сериализации и отрисовки шаблона.
+def snapshot_etag(*parts):
+    return hashlib.sha1(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+# Ответ 304, если у клиента уже есть ответ с этим ETag (в том числе сжатый), иначе None
+def not_modified(etag):
+    matched = matching_etag(etag)
+    if matched is None:
+        return None
+    response = Response(status=304)
+    response.set_etag(matched)
+    response.headers['Cache-Control'] = SNAPSHOT_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+# Страница по снимку сборщика с ETag. Если в сессии есть флеш-сообщения,
+# страница отрисовывается целиком: они выводятся один раз.
+def snapshot_page(etag, render):
+    cacheable = '_flashes' not in session
+    if cacheable:
+        response = not_modified(etag)
+        if response is not None:
+            return response
+    response = make_response(render())
+    if cacheable:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = SNAPSHOT_CACHE_CONTROL
+    return response
+
 # Страница с лимитами
-@app.route('/limits')
+@bp.route('/limits')
 def limits():
     try:
         access_token = get_valid_access_token()
     except Exception as e:
         flash(f"Ошибка: {str(e)}", "danger")
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-        'User-Agent': USER_AGENT,
-        'Accept': 'application/json'
-    }
+    headers = api_headers(access_token)
 
-    # Получение информации о текущем пользователе
-    user_info_url = 'https://api.hh.ru/me'
-    try:
-        user_response = requests.get(user_info_url, headers=headers, timeout=REQUEST_TIMEOUT)
-    except requests.Timeout:
-        logger.error("Timeout при получении информации о пользователе")
-        flash("Превышено время ожидания ответа от HH.ru. Попробуйте позже.", "danger")
-        return redirect(url_for('index'))
-    except requests.RequestException as e:
-        logger.error(f"Ошибка сети при получении информации о пользователе: {str(e)}")
-        flash("Ошибка соединения с HH.ru. Попробуйте позже.", "danger")
-        return redirect(url_for('index'))
-    if user_response.status_code != 200:
-        flash(f"Ошибка при получении информации о пользователе: {user_response.status_code}\n{user_response.text}", "danger")
-        return redirect(url_for('index'))
+    # Получение информации о текущем пользователе (из кеша, если есть)
+    user_info = get_user_info(access_token, headers)
+    if user_info is None:
+        return redirect(url_for('main.index'))
 
-    user_info = user_response.json()
     employer = user_info.get('employer')
     if not employer or 'id' not in employer:
         flash("Не удалось получить employer_id из данных пользователя.", "danger")
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     employer_id = employer['id']
 
@@ -255,10 +548,85 @@ def limits():
     current_manager = user_info.get('manager')
     if not current_manager or 'id' not in current_manager:
         flash("Не удалось получить manager_id из данных пользователя.", "danger")
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     manager_id = current_manager['id']
 
+    # Режим просмотра всех менеджеров работодателя: страница отображается сразу,
+    # карточки менеджеров заполняются скриптом по мере получения данных из /api/limits.
+    # static=1 — прежняя страница, полностью сформированная на сервере.
+    if request.args.get('scope') == 'all' and request.args.get('static') != '1':
+        return render_template('limits.html', managers=[], scope='all', progressive=True)
+
+    if request.args.get('scope') == 'all':
+        # Свежий снимок сборщика показывается без запросов к HH.ru
+        # (только по менеджерам, доступным пользователю)
+        store = get_snapshot_store()
+        if store is not None:
+            snapshot_id, taken_at = store.latest_id(employer_id)
+            if snapshot_usable(employer_id, taken_at):
+                stale = snapshot_stale(taken_at)
+                accessible = get_accessible_managers(employer_id, manager_id, headers)
+                def render():
+                    summaries = store.summaries(employer_id)
+                    manager_limits = [{
+                        'manager_id': item['manager_id'],
+                        'manager_name': item['manager_name'],
+                        'limits': item['limits'] if item['limits'] is not None else NO_DATA_MESSAGE,
+                        'summary': summaries.get(item['manager_id'])
+                    } for item in store.items(snapshot_id) if item['manager_id'] in accessible]
+                    return render_template('limits.html', managers=manager_limits, scope='all',
+                                           snapshot_time=format_snapshot_time(taken_at), format_time=format_snapshot_time,
+                                           stale_time=format_snapshot_time(taken_at) if stale else None)
+                return snapshot_page(snapshot_etag('limits', employer_id, snapshot_id, stale, access_tag(accessible)), render)
+
+        managers = get_managers(employer_id, headers)
+        if managers is None:
+            flash("Не удалось получить список менеджеров работодателя.", "danger")
+            return redirect(url_for('main.limits'))
+        accessible = get_accessible_managers(employer_id, manager_id, headers)
+        managers = [manager for manager in managers if str(manager.get('id')) in accessible]
+
+        stale = {}
+        results = fetch_all_limits(employer_id, managers, partial(get_limits_or_last_known, headers=headers, stale=stale))
+        manager_limits = []
+        failed = []
+        for item in results:
+            if item['error']:
+                failed.append(f"{item['manager_name']} (ID: {item['manager_id']})")
+            fetched_at = stale.get(str(item['manager_id']))
+            manager_limits.append({
+                'manager_id': item['manager_id'],
+                'manager_name': item['manager_name'],
+                'limits': item['limits'] if item['limits'] is not None else NO_DATA_MESSAGE,
+                'stale_time': format_snapshot_time(fetched_at) if fetched_at else None
+            })
+        if failed:
+            flash(f"Не удалось получить лимиты для менеджеров: {', '.join(failed)}", "warning")
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Статистика HTTP-соединений: %s", hh_client.get_connection_stats())
+        return render_template('limits.html', managers=manager_limits, scope='all',
+                               stale_time=format_snapshot_time(min(stale.values())) if stale else None)
+
+    # Свежий снимок сборщика показывается без запросов к HH.ru
+    store = get_snapshot_store()
+    if store is not None:
+        item = store.latest_for_manager(employer_id, manager_id)
+        if item and snapshot_usable(employer_id, item['taken_at']):
+            stale = snapshot_stale(item['taken_at'])
+            def render():
+                manager_limits = [{
+                    'manager_id': manager_id,
+                    'manager_name': item['manager_name'],
+                    'limits': item['limits'],
+                    'summary': store.summaries(employer_id).get(str(manager_id))
+                }]
+                return render_template('limits.html', managers=manager_limits, scope='me',
+                                       snapshot_time=format_snapshot_time(item['taken_at']), format_time=format_snapshot_time,
+                                       stale_time=format_snapshot_time(item['taken_at']) if stale else None)
+            return snapshot_page(snapshot_etag('limits', employer_id, manager_id, item['snapshot_id'], stale), render)
+
     # Получение информации о менеджере для полного имени
     manager_info = get_manager_info(employer_id, manager_id, headers)
     if manager_info:
@@ -267,7 +635,9 @@ def limits():
         manager_name = 'Без имени'
 
     # Получение лимитов просмотра резюме для менеджера
-    limits = get_resume_view_limits(employer_id, manager_id, headers)
+    stale = {}
+    limits = get_limits_or_last_known(employer_id, manager_id, headers, stale)
+    stale_time = format_snapshot_time(stale[str(manager_id)]) if stale else None
     if limits and isinstance(limits, dict):
         manager_limits = [{
             'manager_id': manager_id,
@@ -278,19 +648,275 @@ def limits():
         manager_limits = [{
             'manager_id': manager_id,
             'manager_name': manager_name,
-            'limits': 'Нет данных или доступ запрещен.'
+            'limits': NO_DATA_MESSAGE
         }]
         # Дополнительный вывод ошибки в лог и флеш-сообщение
         flash(f"Не удалось получить лимиты для менеджера: {manager_name} (ID: {manager_id}). Возможные причины: отсутствуют назначенные лимиты или недостаточные права доступа.", "warning")
 
-    return render_template('limits.html', managers=manager_limits)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Статистика HTTP-соединений: %s", hh_client.get_connection_stats())
+    return render_template('limits.html', managers=manager_limits, scope='me', stale_time=stale_time)
+
+# Прогноз расхода просмотров резюме по истории снимков сборщика
+@bp.route('/limits/forecast')
+def forecast():
+    try:
+        access_token = get_valid_access_token()
+    except Exception as e:
+        flash(f"Ошибка: {str(e)}", "danger")
+        return redirect(url_for('main.index'))
+
+    user_info = get_user_info(access_token, api_headers(access_token))
+    if user_info is None:
+        return redirect(url_for('main.index'))
+    employer_id = (user_info.get('employer') or {}).get('id')
+    if not employer_id:
+        flash("Не удалось получить employer_id из данных пользователя.", "danger")
+        return redirect(url_for('main.index'))
+
+    store = get_snapshot_store()
+    if store is None:
+        flash("Нет истории лимитов: запустите сборщик (python get.py collect).", "warning")
+        return redirect(url_for('main.limits'))
+
+    # numpy загружается только при открытии прогноза
+    from analytics import forecast_for_employer
+    headers = api_headers(access_token)
+    accessible = get_accessible_managers(employer_id, (user_info.get('manager') or {}).get('id'), headers)
+    managers, summary = forecast_for_employer(store, employer_id, manager_ids=accessible)
+    return render_template('forecast.html', managers=managers, summary=summary, format_time=format_snapshot_time)
+
+# Потоковая выгрузка лимитов всех менеджеров (NDJSON или CSV): строки
+# отправляются клиенту по мере получения ответов HH.ru
+@bp.route('/limits/export.<fmt>')
+def export_limits(fmt):
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+
+    try:
+        access_token = get_valid_access_token()
+    except Exception as e:
+        flash(f"Ошибка: {str(e)}", "danger")
+        return redirect(url_for('main.index'))
+
+    headers = api_headers(access_token)
+    user_info = get_user_info(access_token, headers)
+    if user_info is None:
+        return redirect(url_for('main.index'))
+    employer_id = (user_info.get('employer') or {}).get('id')
+    if not employer_id:
+        flash("Не удалось получить employer_id из данных пользователя.", "danger")
+        return redirect(url_for('main.index'))
+
+    managers = get_managers(employer_id, headers)
+    if managers is None:
+        flash("Не удалось получить список менеджеров работодателя.", "danger")
+        return redirect(url_for('main.limits'))
+    accessible = get_accessible_managers(employer_id, (user_info.get('manager') or {}).get('id'), headers)
+    managers = [manager for manager in managers if str(manager.get('id')) in accessible]
+
+    results = iter_limits(employer_id, managers, partial(get_cached_resume_view_limits, headers=headers))
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+    filename = f"manager_limits_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return Response(
+        stream_with_context(stream_records(results, fmt)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+# Ответ API: компактный JSON с ETag. Повторный запрос с If-None-Match
+# получает 304 без тела, если данные не изменились. Без etag он считается
+# по телу ответа; ответы по снимку передают ETag снимка.
+def json_response(data, status=200, etag=None):
+    response = Response(json.dumps(data, ensure_ascii=False, separators=(',', ':')),
+                        status=status, mimetype='application/json')
+    if status == 200:
+        if etag is None:
+            response.add_etag()
+            response.headers['Cache-Control'] = LIVE_CACHE_CONTROL
+        else:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = SNAPSHOT_CACHE_CONTROL
+        response.make_conditional(request)
+    return response
+
+def api_error(message, status):
+    return json_response({'error': message}, status)
+
+# Запись API для менеджера. fetched_at — время получения данных из HH.ru (из кеша),
+# поэтому ETag не меняется, пока не обновились сами данные. Последние известные
+# лимиты, показанные из-за недоступности HH.ru (stale), помечаются stale: true.
+def api_record(employer_id, item, stale=None):
+    fetched_at = (stale or {}).get(str(item['manager_id']))
+    if fetched_at:
+        return dict(make_record(item, fetched_at), stale=True)
+    return make_record(item, limits_cache.fetched_at(limits_cache_key(employer_id, item['manager_id'])))
+
+# Токен и работодатель текущего пользователя для API.
+# Возвращает ((headers, employer_id, manager_id), None) или (None, ответ с ошибкой).
+def api_identity():
+    try:
+        access_token = get_valid_access_token()
+    except Exception as e:
+        return None, api_error(str(e), 401)
+
+    headers = api_headers(access_token)
+    errors = []
+    user_info = get_user_info(access_token, headers, notify=lambda message, category: errors.append(message))
+    if user_info is None:
+        return None, api_error(errors[0] if errors else "Не удалось получить информацию о пользователе.", 502)
+
+    employer_id = (user_info.get('employer') or {}).get('id')
+    if not employer_id:
+        return None, api_error("Не удалось получить employer_id из данных пользователя.", 502)
+    return (headers, employer_id, (user_info.get('manager') or {}).get('id')), None
+
+# Потоковый ответ /api/limits: первая строка — количество менеджеров,
+# затем по строке на менеджера в порядке получения ответов HH.ru
+def stream_api_limits(total, records):
+    yield format_ndjson({'total': total, 'snapshot_time': None, 'stale': False})
+    for record in records:
+        yield format_ndjson(record)
+
+# Лимиты всех менеджеров работодателя в JSON. С параметром stream=1 ответ
+# отдается в NDJSON по мере получения данных (для страницы /limits?scope=all).
+@bp.route('/api/limits')
+def api_limits():
+    identity, error = api_identity()
+    if error:
+        return error
+    headers, employer_id, manager_id = identity
+    stream = request.args.get('stream') == '1'
+    accessible = get_accessible_managers(employer_id, manager_id, headers)
+
+    # Свежий снимок сборщика отдается без запросов к HH.ru
+    store = get_snapshot_store()
+    if store is not None:
+        snapshot_id, taken_at = store.latest_id(employer_id)
+        if snapshot_usable(employer_id, taken_at):
+            stale = snapshot_stale(taken_at)
+            etag = snapshot_etag('api_limits', employer_id, snapshot_id, stream, stale, access_tag(accessible))
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            summaries = store.summaries(employer_id)
+            marker = {'stale': True} if stale else {}
+            records = [dict(make_record(item, taken_at), summary=summaries.get(item['manager_id']), **marker)
+                       for item in store.items(snapshot_id) if item['manager_id'] in accessible]
+            if stream:
+                lines = [format_ndjson({'total': len(records), 'snapshot_time': taken_at, 'stale': stale})]
+                lines.extend(format_ndjson(record) for record in records)
+                response = Response(''.join(lines), mimetype='application/x-ndjson')
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = SNAPSHOT_CACHE_CONTROL
+                return response
+            return json_response({'employer_id': employer_id, 'snapshot_time': taken_at, 'stale': stale, 'managers': records}, etag=etag)
+
+    managers = get_managers(employer_id, headers)
+    if managers is None:
+        return api_error("Не удалось получить список менеджеров работодателя.", 502)
+    managers = [manager for manager in managers if str(manager.get('id')) in accessible]
+
+    stale = {}
+    fetch_limits = partial(get_limits_or_last_known, headers=headers, stale=stale)
+    if stream:
+        results = iter_limits(employer_id, managers, fetch_limits)
+        total = sum(1 for manager in managers if manager.get('id'))
+        return Response(stream_with_context(stream_api_limits(total, (api_record(employer_id, item, stale) for item in results))),
+                        mimetype='application/x-ndjson')
+
+    results = fetch_all_limits(employer_id, managers, fetch_limits)
+    return json_response({
+        'employer_id': employer_id,
+        'snapshot_time': None,
+        'stale': bool(stale),
+        'managers': [api_record(employer_id, item, stale) for item in results]
+    })
+
+# Лимиты одного менеджера в JSON
+@bp.route('/api/managers/<manager_id>/limits')
+def api_manager_limits(manager_id):
+    if not manager_id.isdigit():
+        abort(404)
+    identity, error = api_identity()
+    if error:
+        return error
+    headers, employer_id, own_manager_id = identity
+    # Кеш и снимки общие для работодателя: лимиты отдаются, только если HH.ru
+    # показывает этого менеджера пользователю
+    if manager_id not in get_accessible_managers(employer_id, own_manager_id, headers):
+        return api_error(f"Нет доступа к лимитам менеджера (ID: {manager_id}).", 403)
+
+    store = get_snapshot_store()
+    if store is not None:
+        item = store.latest_for_manager(employer_id, manager_id)
+        if item and snapshot_usable(employer_id, item['taken_at']):
+            stale = snapshot_stale(item['taken_at'])
+            etag = snapshot_etag('api_manager_limits', employer_id, manager_id, item['snapshot_id'], stale)
+            response = not_modified(etag)
+            if response is not None:
+                return response
+            summary = store.summaries(employer_id).get(manager_id)
+            marker = {'stale': True} if stale else {}
+            return json_response(dict(make_record(item, item['taken_at']), summary=summary, **marker), etag=etag)
+
+    manager_info = get_manager_info(employer_id, manager_id, headers)
+    stale = {}
+    limits = get_limits_or_last_known(employer_id, manager_id, headers, stale)
+    if limits is None:
+        return api_error(f"Не удалось получить лимиты для менеджера (ID: {manager_id}).", 502)
+    return json_response(api_record(employer_id, {
+        'manager_id': manager_id,
+        'manager_name': (manager_info or {}).get('full_name') or 'Без имени',
+        'limits': limits if isinstance(limits, dict) else None,
+        'error': None if isinstance(limits, dict) else limits
+    }, stale))
 
 # Страница выхода
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
+    invalidate_user_cache(session.get('access_token'))
+    regenerate_session(session)
     session.clear()
     flash("Вы успешно вышли из системы.", "success")
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
+
+# Создание приложения: настройки, логирование, хранилище сессий и маршруты.
+# Gunicorn вызывает ее в каждом воркере (app:create_app()).
+def create_app():
+    # Настройка логирования: записи передаются через очередь отдельному писателю
+    logging_setup.setup_logging()
+
+    app = Flask(__name__)
+    # Настройки из .env
+    app.config['HH_CLIENT_ID'] = os.getenv('CLIENT_ID')
+    app.config['HH_CLIENT_SECRET'] = os.getenv('CLIENT_SECRET')
+    app.config['HH_REDIRECT_URI'] = os.getenv('REDIRECT_URI')
+    app.config['HH_USER_AGENT'] = os.getenv('USER_AGENT', 'HH Limits/1.0')
+    app.secret_key = os.getenv('SECRET_KEY')
+    app.config['JSON_AS_ASCII'] = False
+    app.config['SESSION_COOKIE_HTTPONLY'] = True  # Защита от XSS
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # CSRF защита
+
+    # Проверка наличия обязательных настроек
+    if not all([app.config['HH_CLIENT_ID'], app.config['HH_CLIENT_SECRET'], app.config['HH_REDIRECT_URI'], app.secret_key]):
+        logger.error("Отсутствуют обязательные переменные окружения")
+        raise Exception("Пожалуйста, убедитесь, что все обязательные переменные заданы в файле .env")
+
+    # Серверное хранилище сессий: токены хранятся на сервере, cookie содержит только идентификатор
+    session_store = create_session_store()
+    if session_store is not None:
+        app.session_interface = ServerSideSessionInterface(session_store)
+
+    # Сжатие ответов регистрируется до маршрутов: обработчики after_request
+    # вызываются в обратном порядке, поэтому сжатие выполняется последним
+    app.after_request(compress_response)
+    app.register_blueprint(bp)
+    before_render_template.connect(start_render_timer, app)
+    template_rendered.connect(observe_render, app)
+    # Метрики воркеров gunicorn объединяются через общий каталог (задается в gunicorn_config.py)
+    metrics.start_multiprocess()
+    return app
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '6859')))
+    create_app().run(host='0.0.0.0', port=int(os.getenv('PORT', '6859')))
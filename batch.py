@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hh_client
+from hh_client import API_URL, OAUTH_URL
+from governor import Governor, BATCH, GOVERNOR_RATE, GOVERNOR_BURST
+from fetcher import fetch_all_limits, NO_DATA_MESSAGE
+from managers import ManagerDirectory
+from tokens import TokenManager, parse_expires_at
+
+# Пакетный сбор лимитов по нескольким аккаунтам работодателей (python get.py batch)
+ACCOUNTS_FILE = os.getenv('ACCOUNTS_FILE', 'accounts.json')  # список аккаунтов
+ACCOUNT_TOKENS_DB = os.getenv('ACCOUNT_TOKENS_DB', 'data/accounts.db')  # токены аккаунтов
+BATCH_PROCESSES = int(os.getenv('BATCH_PROCESSES', '4'))  # аккаунтов, обрабатываемых одновременно
+
+
+# Ошибка пакетного сбора по одному аккаунту
+class BatchError(Exception):
+    pass
+
+
+# Загрузка списка аккаунтов. Формат файла — JSON-массив:
+# [{"name": "agency-a", "refresh_token": "...", "rate": 3}, ...]
+# name и refresh_token обязательны; access_token, expires_at, client_id,
+# client_secret и rate (запросов в секунду для аккаунта) — необязательны.
+def load_roster(path=ACCOUNTS_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        accounts = json.load(f)
+    if not isinstance(accounts, list):
+        raise BatchError(f'{path}: ожидается JSON-массив аккаунтов')
+    names = set()
+    for account in accounts:
+        if not isinstance(account, dict) or not account.get('name') or not account.get('refresh_token'):
+            raise BatchError(f'{path}: у каждого аккаунта должны быть name и refresh_token')
+        if account['name'] in names:
+            raise BatchError(f"{path}: аккаунт {account['name']} указан дважды")
+        names.add(account['name'])
+    return accounts
+
+
+# Хранилище токенов аккаунтов в SQLite. Файл доступен только владельцу,
+# каждая запись сохраняется транзакцией, поэтому токены не теряются при
+# одновременном обновлении из нескольких процессов. Список аккаунтов
+# (ACCOUNTS_FILE) при этом не перезаписывается.
+class AccountTokenStore:
+    def __init__(self, path=ACCOUNT_TOKENS_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        # Файл базы создается с правами только для владельца до подключения:
+        # SQLite создает файлы -wal и -shm (в них тоже токены) с правами файла базы
+        os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+        os.chmod(path, 0o600)
+        self._local = threading.local()
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS account_tokens ('
+            'account TEXT PRIMARY KEY, access_token TEXT, refresh_token TEXT NOT NULL, '
+            'expires_at REAL, updated_at REAL NOT NULL)'
+        )
+        # Файлы, созданные прежними версиями с правами по умолчанию
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.chmod(path + suffix, 0o600)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self, account):
+        row = self._connect().execute(
+            'SELECT access_token, refresh_token, expires_at FROM account_tokens WHERE account = ?', (account,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'access_token': row[0], 'refresh_token': row[1], 'expires_at': row[2]}
+
+    def save(self, account, tokens):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO account_tokens (account, access_token, refresh_token, expires_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (account, tokens['access_token'], tokens['refresh_token'], tokens['expires_at'], time.time())
+        )
+
+
+# Обновление токена аккаунта через OAuth HH.ru
+def _refresh_func(client_id, client_secret):
+    def refresh(refresh_token):
+        response = hh_client.post(f'{OAUTH_URL}/oauth/token', data={
+            'grant_type': 'refresh_token',
+            'refresh_token': refresh_token,
+            'client_id': client_id,
+            'client_secret': client_secret
+        })
+        if response.status_code != 200:
+            raise BatchError(f'Ошибка при обновлении токена доступа: {response.status_code}\n{response.text}')
+        return response.json()
+    return refresh
+
+
+# Действующий access_token аккаунта: из хранилища, а при первом запуске —
+# из списка аккаунтов. Обновляется заранее через TokenManager; force — обновить
+# независимо от срока (токен отозван или недействителен).
+def _access_token(account, store, token_manager, force=False):
+    tokens = store.load(account['name']) or {
+        'access_token': account.get('access_token'),
+        'refresh_token': account['refresh_token'],
+        'expires_at': parse_expires_at(account.get('expires_at'))
+    }
+    if force or not tokens['access_token'] or token_manager.needs_refresh(tokens['expires_at']):
+        result = token_manager.refresh(tokens['refresh_token'])
+        tokens = {key: result[key] for key in ('access_token', 'refresh_token', 'expires_at')}
+        store.save(account['name'], tokens)
+    return tokens['access_token']
+
+
+def _headers(access_token, user_agent):
+    return {
+        'Authorization': f'Bearer {access_token}',
+        'User-Agent': user_agent,
+        'Accept': 'application/json'
+    }
+
+
+# Лимиты одного менеджера: dict, описание ошибки или NO_DATA_MESSAGE
+def _limits_fetcher(headers):
+    def fetch(employer_id, manager_id):
+        url = f'{API_URL}/employers/{employer_id}/managers/{manager_id}/limits/resume'
+        response = hh_client.get(url, headers=headers, params={'locale': 'RU', 'host': 'hh.ru'})
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code in (403, 404):
+            return NO_DATA_MESSAGE
+        return f'Ошибка при получении лимитов: {response.status_code}'
+    return fetch
+
+
+# Сбор лимитов одного аккаунта. Выполняется в отдельном процессе пула,
+# у каждого аккаунта свой ограничитель частоты (rate из списка аккаунтов).
+def collect_account(account, options):
+    started = time.time()
+    # Счетчик запросов пула общий для процесса, который может обработать несколько аккаунтов
+    requests_before = hh_client.get_connection_stats()['requests']
+    rate = float(account.get('rate') or options['rate'])
+    # В процессе нет интерактивных запросов, поэтому резерв корзины для них не нужен
+    hh_client.set_governor(Governor(rate=rate, burst=min(GOVERNOR_BURST, max(1.0, rate * 2)),
+                                    batch_reserve=0, state_file=''))
+    hh_client.set_default_priority(BATCH)
+
+    summary = {'account': account['name'], 'employer_id': None, 'results': [], 'error': None}
+    try:
+        store = AccountTokenStore(options['tokens_db'])
+        token_manager = TokenManager(_refresh_func(
+            account.get('client_id') or options['client_id'],
+            account.get('client_secret') or options['client_secret']
+        ))
+        access_token = _access_token(account, store, token_manager)
+        response = hh_client.get(f'{API_URL}/me', headers=_headers(access_token, options['user_agent']))
+        if response.status_code in (401, 403):
+            # Токен из хранилища отозван: одна попытка обновить его
+            access_token = _access_token(account, store, token_manager, force=True)
+            response = hh_client.get(f'{API_URL}/me', headers=_headers(access_token, options['user_agent']))
+        if response.status_code != 200:
+            raise BatchError(f'Ошибка при получении информации о пользователе: {response.status_code}')
+        employer_id = (response.json().get('employer') or {}).get('id')
+        if not employer_id:
+            raise BatchError('Аккаунт не является работодателем')
+        summary['employer_id'] = employer_id
+
+        headers = _headers(access_token, options['user_agent'])
+        managers = ManagerDirectory(employer_id).sync(headers)
+        results = fetch_all_limits(employer_id, managers, _limits_fetcher(headers))
+        if options.get('snapshot_db'):
+            from snapshots import SnapshotStore
+            from alerts import Alerter
+            _, changes = SnapshotStore(options['snapshot_db']).record_snapshot(employer_id, results)
+            if changes:
+                Alerter().process(employer_id, changes)
+        summary['results'] = results
+    except Exception as e:
+        summary['error'] = str(e)
+    summary['seconds'] = time.time() - started
+    summary['requests'] = hh_client.get_connection_stats()['requests'] - requests_before
+    return summary
+
+
+# Параллельный сбор по всем аккаунтам. Результаты аккаунтов выдаются по мере
+# готовности; ошибка одного аккаунта не прерывает остальные.
+def run_batch(accounts, options, processes=BATCH_PROCESSES):
+    processes = max(1, min(processes, len(accounts)))
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {executor.submit(collect_account, account, options): account for account in accounts}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {'account': futures[future]['name'], 'employer_id': None, 'results': [],
+                       'error': str(e), 'seconds': 0.0, 'requests': 0}
+
+
+# Параметры по умолчанию для collect_account
+def default_options(client_id, client_secret, user_agent, snapshot_db=None):
+    return {
+        'client_id': client_id,
+        'client_secret': client_secret,
+        'user_agent': user_agent,
+        'rate': GOVERNOR_RATE,
+        'tokens_db': ACCOUNT_TOKENS_DB,
+        'snapshot_db': snapshot_db
+    }
@@ -0,0 +1,354 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+# Нагрузочный тест веб-приложения и get.py против локальной замены API HH.ru (mock_hh.py).
+# Отчет: пропускная способность, p50/p90/p99 длительности, число запросов к HH.ru
+# и время запуска (импорт app.py и get.py, первый ответ gunicorn) с бюджетом
+# --max-import-time / --max-first-request.
+# С --baseline сравнивает результат с сохраненным (--output) и завершается с кодом 1
+# при ухудшении больше чем на --max-regression.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f'Сервис {url} не запустился за {timeout} с')
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def latency_summary(durations):
+    return {
+        'p50': percentile(durations, 0.5),
+        'p90': percentile(durations, 0.9),
+        'p99': percentile(durations, 0.99),
+        'max': max(durations) if durations else 0.0
+    }
+
+
+class MockServer:
+    def __init__(self, args, workdir):
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(BENCH_DIR, 'mock_hh.py'), '--port', str(self.port),
+             '--managers', str(args.managers), '--latency', str(args.latency),
+             '--error-rate', str(args.error_rate), '--rate-limit', str(args.rate_limit)],
+            stdout=open(os.path.join(workdir, 'mock.log'), 'w'), stderr=subprocess.STDOUT
+        )
+        wait_for(f'{self.url}/_stats')
+
+    def stats(self):
+        return requests.get(f'{self.url}/_stats', timeout=5).json()
+
+    def reset(self):
+        requests.post(f'{self.url}/_reset', timeout=5)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+# Окружение приложения: все адреса HH.ru указывают на mock, состояние — во временном каталоге
+def app_env(args, mock, workdir, port):
+    env = dict(os.environ)
+    env.update({
+        'HH_API_URL': mock.url,
+        'HH_OAUTH_URL': mock.url,
+        'CLIENT_ID': 'bench',
+        'CLIENT_SECRET': 'bench',
+        'REDIRECT_URI': f'http://127.0.0.1:{port}/callback',
+        'SECRET_KEY': 'bench-secret',
+        'PORT': str(port),
+        'SESSION_DB_PATH': os.path.join(workdir, 'sessions.db'),
+        'SNAPSHOT_DB_PATH': os.path.join(workdir, 'limits.db'),
+        'MANAGERS_CACHE_DIR': os.path.join(workdir, 'managers'),
+        'TOKEN_LOCK_DIR': os.path.join(workdir, 'tokens'),
+        'LOG_FILE': '',
+        'LOG_LEVEL': 'WARNING',
+        'GOVERNOR_RATE': str(args.governor_rate),
+        'GOVERNOR_BURST': str(args.governor_rate * 2),
+        'GUNICORN_WORKERS': str(args.workers),
+        'GUNICORN_WORKER_CLASS': args.worker_class
+    })
+    return env
+
+
+def start_gunicorn(env, workdir):
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py', '--access-logfile', '/dev/null', 'app:create_app()'],
+        cwd=ROOT, env=env,
+        stdout=open(os.path.join(workdir, 'gunicorn.log'), 'a'), stderr=subprocess.STDOUT
+    )
+
+
+def run_web(args, mock, workdir):
+    port = free_port()
+    env = app_env(args, mock, workdir, port)
+    server = start_gunicorn(env, workdir)
+    base = f'http://127.0.0.1:{port}'
+    try:
+        wait_for(f'{base}/')
+        # Авторизация через mock: /login -> /oauth/authorize -> /callback
+        login = requests.Session()
+        login.get(f'{base}/login', timeout=60)
+        if login.get(f'{base}/api/limits', timeout=60).status_code != 200:
+            raise RuntimeError('Не удалось авторизоваться в приложении через mock HH API')
+        cookies = login.cookies.get_dict()
+
+        # Прогрев (кеши, справочник менеджеров), затем замер
+        requests.get(f'{base}{args.path}', cookies=cookies, timeout=60)
+        mock.reset()
+
+        def one(_):
+            started = time.perf_counter()
+            try:
+                response = requests.get(f'{base}{args.path}', cookies=cookies, timeout=60, allow_redirects=False)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    durations = [duration for duration, ok in results if ok]
+    upstream = mock.stats()
+    return {
+        'path': args.path,
+        'requests': len(results),
+        'errors': sum(1 for _, ok in results if not ok),
+        'throughput': len(results) / elapsed if elapsed else 0.0,
+        'latency': latency_summary(durations),
+        'upstream_calls': upstream['total'],
+        'upstream_per_request': upstream['total'] / len(results) if results else 0.0,
+        'upstream': upstream['calls']
+    }
+
+
+def run_cli(args, mock, workdir):
+    env = app_env(args, mock, workdir, free_port())
+    env.update({
+        'ACCESS_TOKEN': 'mock-access',
+        'REFRESH_TOKEN': 'mock-refresh',
+        'ACCESS_TOKEN_EXPIRES_AT': '2099-01-01 00:00:00'
+    })
+    output = os.path.join(workdir, 'export.ndjson')
+    mock.reset()
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'get.py'), 'export', '--format', 'ndjson', '--output', output],
+        cwd=workdir, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f'get.py завершился с ошибкой:\n{result.stdout}\n{result.stderr}')
+    with open(output, encoding='utf-8') as f:
+        written = sum(1 for _ in f)
+    upstream = mock.stats()
+    return {
+        'managers': written,
+        'seconds': elapsed,
+        'managers_per_second': written / elapsed if elapsed else 0.0,
+        'upstream_calls': upstream['total'],
+        'upstream': upstream['calls']
+    }
+
+
+# Время импорта модуля в отдельном интерпретаторе (медиана нескольких запусков)
+def import_time(module, env, runs):
+    code = f'import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)'
+    durations = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f'Ошибка импорта {module}:\n{result.stderr}')
+        durations.append(float(result.stdout.strip().splitlines()[-1]))
+    return percentile(durations, 0.5)
+
+
+# Время от запуска gunicorn до первого успешного ответа
+def first_request_time(env, workdir, port):
+    started = time.perf_counter()
+    server = start_gunicorn(env, workdir)
+    try:
+        deadline = started + 60
+        while time.perf_counter() < deadline:
+            try:
+                if requests.get(f'http://127.0.0.1:{port}/', timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except requests.RequestException:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError('Приложение не ответило за 60 с')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run_startup(args, mock, workdir):
+    port = free_port()
+    env = app_env(args, mock, workdir, port)
+    return {
+        'import_app': import_time('app', env, args.startup_runs),
+        'import_get': import_time('get', env, args.startup_runs),
+        'first_request': percentile([first_request_time(env, workdir, port) for _ in range(args.startup_runs)], 0.5)
+    }
+
+
+def print_report(report):
+    print(f"Менеджеров: {report['config']['managers']}, задержка HH: {report['config']['latency'] * 1000:.0f} мс, "
+          f"ошибок HH: {report['config']['error_rate']:.0%}, лимит HH: {report['config']['rate_limit'] or 'нет'}")
+    web = report.get('web')
+    if web:
+        latency = web['latency']
+        print(f"\nВеб ({web['path']}): {web['requests']} запросов, ошибок {web['errors']}, {web['throughput']:.1f} запросов/с")
+        print(f"  p50 {latency['p50'] * 1000:.0f} мс, p90 {latency['p90'] * 1000:.0f} мс, "
+              f"p99 {latency['p99'] * 1000:.0f} мс, max {latency['max'] * 1000:.0f} мс")
+        print(f"  запросов к HH: {web['upstream_calls']} ({web['upstream_per_request']:.1f} на страницу) {web['upstream']}")
+    cli = report.get('cli')
+    if cli:
+        print(f"\nget.py export: {cli['managers']} менеджеров за {cli['seconds']:.2f} с "
+              f"({cli['managers_per_second']:.1f}/с), запросов к HH: {cli['upstream_calls']} {cli['upstream']}")
+    startup = report.get('startup')
+    if startup:
+        print(f"\nЗапуск: импорт app.py {startup['import_app'] * 1000:.0f} мс, get.py {startup['import_get'] * 1000:.0f} мс, "
+              f"первый ответ gunicorn через {startup['first_request'] * 1000:.0f} мс")
+
+
+# Сравнение с базовым отчетом: рост p99 и длительности или падение пропускной способности
+def compare(report, baseline, max_regression):
+    problems = []
+    if report.get('web') and baseline.get('web'):
+        current, base = report['web'], baseline['web']
+        if current['latency']['p99'] > base['latency']['p99'] * (1 + max_regression):
+            problems.append(f"p99: {base['latency']['p99'] * 1000:.0f} -> {current['latency']['p99'] * 1000:.0f} мс")
+        if current['throughput'] < base['throughput'] * (1 - max_regression):
+            problems.append(f"пропускная способность: {base['throughput']:.1f} -> {current['throughput']:.1f} запросов/с")
+        if current['upstream_per_request'] > base['upstream_per_request'] * (1 + max_regression):
+            problems.append(f"запросов к HH на страницу: {base['upstream_per_request']:.1f} -> {current['upstream_per_request']:.1f}")
+    if report.get('cli') and baseline.get('cli'):
+        current, base = report['cli'], baseline['cli']
+        if current['seconds'] > base['seconds'] * (1 + max_regression):
+            problems.append(f"get.py export: {base['seconds']:.2f} -> {current['seconds']:.2f} с")
+        if current['upstream_calls'] > base['upstream_calls'] * (1 + max_regression):
+            problems.append(f"get.py запросов к HH: {base['upstream_calls']} -> {current['upstream_calls']}")
+    if report.get('startup') and baseline.get('startup'):
+        current, base = report['startup'], baseline['startup']
+        for key, title in (('import_app', 'импорт app.py'), ('import_get', 'импорт get.py'), ('first_request', 'первый ответ')):
+            if current[key] > base[key] * (1 + max_regression):
+                problems.append(f"{title}: {base[key] * 1000:.0f} -> {current[key] * 1000:.0f} мс")
+    return problems
+
+
+# Проверка бюджета времени запуска независимо от базового отчета
+def check_startup_budget(startup, max_import_time, max_first_request):
+    problems = []
+    for key, title in (('import_app', 'импорт app.py'), ('import_get', 'импорт get.py')):
+        if startup[key] > max_import_time:
+            problems.append(f"{title}: {startup[key] * 1000:.0f} мс при бюджете {max_import_time * 1000:.0f} мс")
+    if startup['first_request'] > max_first_request:
+        problems.append(f"первый ответ: {startup['first_request'] * 1000:.0f} мс при бюджете {max_first_request * 1000:.0f} мс")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест hh_limits против mock HH API')
+    parser.add_argument('--scenario', choices=('web', 'cli', 'startup', 'all'), default='all')
+    parser.add_argument('--managers', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.1, help='средняя задержка ответа HH, секунды')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 503 от HH')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='запросов в секунду до ответа 429 (0 — без ограничения)')
+    parser.add_argument('--path', default='/api/limits', help='адрес веб-приложения для нагрузки')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=2, help='воркеров gunicorn')
+    parser.add_argument('--worker-class', default='sync', help='sync или gevent')
+    parser.add_argument('--governor-rate', type=float, default=1000.0, help='GOVERNOR_RATE приложения')
+    parser.add_argument('--startup-runs', type=int, default=3, help='запусков для замера времени запуска')
+    parser.add_argument('--max-import-time', type=float, default=0.5, help='бюджет времени импорта app.py и get.py, секунды')
+    parser.add_argument('--max-first-request', type=float, default=5.0, help='бюджет времени до первого ответа gunicorn, секунды')
+    parser.add_argument('--output', help='сохранить отчет в JSON')
+    parser.add_argument('--baseline', help='отчет JSON для сравнения')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='допустимое ухудшение (доля)')
+    args = parser.parse_args()
+
+    report = {'config': {
+        'managers': args.managers,
+        'latency': args.latency,
+        'error_rate': args.error_rate,
+        'rate_limit': args.rate_limit,
+        'workers': args.workers,
+        'worker_class': args.worker_class,
+        'concurrency': args.concurrency
+    }}
+    with tempfile.TemporaryDirectory(prefix='hh_limits_bench_') as workdir:
+        mock = MockServer(args, workdir)
+        try:
+            if args.scenario in ('web', 'all'):
+                report['web'] = run_web(args, mock, workdir)
+            if args.scenario in ('cli', 'all'):
+                report['cli'] = run_cli(args, mock, workdir)
+            if args.scenario in ('startup', 'all'):
+                report['startup'] = run_startup(args, mock, workdir)
+        finally:
+            mock.stop()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if report.get('startup'):
+        problems = check_startup_budget(report['startup'], args.max_import_time, args.max_first_request)
+        if problems:
+            print('\nПревышен бюджет времени запуска:')
+            for problem in problems:
+                print(f'  {problem}')
+            sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            problems = compare(report, json.load(f), args.max_regression)
+        if problems:
+            print('\nУхудшение по сравнению с ' + args.baseline + ':')
+            for problem in problems:
+                print(f'  {problem}')
+            sys.exit(1)
+        print(f'\nБез ухудшений по сравнению с {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
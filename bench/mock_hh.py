@@ -0,0 +1,222 @@
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode
+
+# Локальная замена API HH.ru для нагрузочного тестирования:
+# OAuth (/oauth/authorize, /oauth/token), /me, /employers/{id}/managers,
+# /employers/{id}/managers/{id} и /employers/{id}/managers/{id}/limits/resume.
+# Задержка, доля ошибок и ограничение частоты (429) настраиваются параметрами.
+# Служебные адреса: GET /_stats — счетчики запросов, POST /_reset — сброс счетчиков.
+
+EMPLOYER_ID = '1'
+CURRENT_MANAGER_ID = '1000'
+
+
+class MockState:
+    def __init__(self, managers, latency, jitter, error_rate, rate_limit):
+        self.managers = managers
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.tokens = float(rate_limit)
+        self.updated_at = time.time()
+        self.started_at = time.time()
+
+    def count(self, name):
+        with self.lock:
+            self.calls[name] += 1
+
+    # Ограничение частоты: token bucket на rate_limit запросов в секунду (0 — без ограничения)
+    def allow(self):
+        if not self.rate_limit:
+            return True
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.rate_limit, self.tokens + (now - self.updated_at) * self.rate_limit)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def delay(self):
+        if self.latency:
+            time.sleep(max(0.0, self.latency * random.uniform(1 - self.jitter, 1 + self.jitter)))
+
+    def stats(self):
+        with self.lock:
+            # status_* — ответы 304/429/503, они уже учтены в счетчике адреса
+            total = sum(value for name, value in self.calls.items() if not name.startswith('status_'))
+            return {'uptime': time.time() - self.started_at, 'calls': dict(self.calls), 'total': total}
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.started_at = time.time()
+
+
+def manager_id(index):
+    return str(int(CURRENT_MANAGER_ID) + index)
+
+
+# Детерминированные лимиты менеджера: расход растет со временем
+def manager_limits(index):
+    limit = 100 + index % 5 * 50
+    spend = min(limit, (int(time.time()) // 60 + index * 7) % (limit + 1))
+    return {
+        'limits': {'resume_view': limit},
+        'spend': {'resume_view': spend},
+        'left': {'resume_view': limit - spend}
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_empty(self, status, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    # Общая обработка: задержка, ограничение частоты и случайные ошибки
+    def upstream(self, name):
+        self.state.count(name)
+        if not self.state.allow():
+            self.state.count('status_429')
+            self.send_json(429, {'errors': [{'type': 'too_many_requests'}]}, {'Retry-After': '1'})
+            return False
+        self.state.delay()
+        if self.state.error_rate and random.random() < self.state.error_rate:
+            self.state.count('status_503')
+            self.send_json(503, {'errors': [{'type': 'service_unavailable'}]})
+            return False
+        return True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        path = urlsplit(self.path).path
+        if path == '/_reset':
+            self.state.reset()
+            return self.send_json(200, {'ok': True})
+        if path == '/oauth/token':
+            if self.upstream('oauth_token'):
+                self.send_json(200, {
+                    'access_token': f'mock-access-{random.getrandbits(32):x}',
+                    'refresh_token': f'mock-refresh-{random.getrandbits(32):x}',
+                    'expires_in': 1209600
+                })
+            return
+        self.send_json(404, {'errors': [{'type': 'not_found'}]})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+
+        if url.path == '/_stats':
+            return self.send_json(200, self.state.stats())
+
+        # Авторизация сразу возвращает пользователя на redirect_uri с кодом
+        if url.path == '/oauth/authorize':
+            redirect_uri = query.get('redirect_uri', [''])[0]
+            return self.send_empty(302, {'Location': f"{redirect_uri}?{urlencode({'code': 'mockcode'})}"})
+
+        if url.path == '/me':
+            if self.upstream('me'):
+                self.send_json(200, {
+                    'id': '1',
+                    'is_employer': True,
+                    'employer': {'id': EMPLOYER_ID, 'name': 'Mock employer'},
+                    'manager': {'id': CURRENT_MANAGER_ID}
+                })
+            return
+
+        if len(parts) >= 3 and parts[0] == 'employers' and parts[2] == 'managers':
+            if len(parts) == 3:
+                return self.managers_page(query)
+            index = int(parts[3]) - int(CURRENT_MANAGER_ID) if parts[3].isdigit() else -1
+            if not 0 <= index < self.state.managers:
+                return self.send_json(404, {'errors': [{'type': 'not_found'}]})
+            if len(parts) == 4:
+                if self.upstream('manager'):
+                    self.send_json(200, {'id': parts[3], 'full_name': f'Менеджер {index}'})
+                return
+            if parts[4:] == ['limits', 'resume']:
+                if self.upstream('limits_resume'):
+                    self.send_json(200, manager_limits(index))
+                return
+
+        self.send_json(404, {'errors': [{'type': 'not_found'}]})
+
+    # Страница списка менеджеров с ETag: повторный запрос с If-None-Match получает 304
+    def managers_page(self, query):
+        if not self.upstream('managers'):
+            return
+        page = int(query.get('page', ['0'])[0])
+        per_page = int(query.get('per_page', ['20'])[0])
+        total = self.state.managers
+        etag = f'"managers-{total}-{page}-{per_page}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.state.count('status_304')
+            return self.send_empty(304, {'ETag': etag})
+        items = [
+            {'id': manager_id(index), 'full_name': f'Менеджер {index}'}
+            for index in range(page * per_page, min(total, (page + 1) * per_page))
+        ]
+        self.send_json(200, {
+            'items': items,
+            'found': total,
+            'page': page,
+            'pages': max(1, (total + per_page - 1) // per_page),
+            'per_page': per_page
+        }, {'ETag': etag})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальная замена API HH.ru для нагрузочного тестирования')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--managers', type=int, default=50, help='количество менеджеров работодателя')
+    parser.add_argument('--latency', type=float, default=0.1, help='средняя задержка ответа, секунды')
+    parser.add_argument('--jitter', type=float, default=0.5, help='разброс задержки (доля от средней)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 503')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='запросов в секунду до ответа 429 (0 — без ограничения)')
+    args = parser.parse_args()
+
+    Handler.state = MockState(args.managers, args.latency, args.jitter, args.error_rate, args.rate_limit)
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    print(f'Mock HH API: http://{args.host}:{args.port}, менеджеров {args.managers}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
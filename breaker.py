@@ -0,0 +1,156 @@
+import os
+import time
+import logging
+import threading
+import requests
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Настройки автоматического выключателя запросов к HH.ru
+BREAKER_ENABLED = os.getenv('BREAKER_ENABLED', '1') != '0'
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', '5'))  # ошибок подряд, после которых цепь размыкается
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))  # пауза между пробными запросами, секунды
+BREAKER_PROBE_TIMEOUT = float(os.getenv('BREAKER_PROBE_TIMEOUT', '3'))  # таймаут пробного запроса, секунды
+
+CLOSED = 'closed'
+OPEN = 'open'
+
+REJECTED = metrics.Counter(
+    'hh_circuit_rejected_total',
+    'Запросы к HH.ru, отклоненные без отправки при разомкнутой цепи',
+    ('endpoint',)
+)
+
+
+# Цепь разомкнута: HH.ru не отвечает, запрос не отправляется.
+# Наследуется от RequestException, чтобы обрабатываться как сетевая ошибка.
+class CircuitOpenError(requests.RequestException):
+    pass
+
+
+# Автоматический выключатель для одного адреса HH.ru (шаблон без идентификаторов):
+# - после failure_threshold ошибок подряд (таймауты, сетевые ошибки, ответы 5xx)
+#   цепь размыкается, и запросы сразу завершаются CircuitOpenError вместо
+#   ожидания таймаута;
+# - пока цепь разомкнута, фоновый поток раз в reset_timeout секунд повторяет
+#   последний неудачный запрос с коротким таймаутом и без токена пользователя;
+#   любой ответ HH.ru с кодом меньше 500 (в том числе 401/403) замыкает цепь.
+# Состояние хранится в памяти процесса: у каждого воркера gunicorn свои
+# выключатели, и при перезапуске воркера они начинают с замкнутой цепи.
+# Чтобы ошибка успела учесться до перезапуска воркера по таймауту, запросы
+# веб-приложения ограничены общим сроком (hh_client.REQUEST_BUDGET).
+class CircuitBreaker:
+    def __init__(self, endpoint, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.opened_total = 0
+        self._probe = None
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        return self.state == OPEN
+
+    # Проверка перед запросом: при разомкнутой цепи запрос не отправляется
+    def before_request(self):
+        if self.state == OPEN:
+            REJECTED.inc(endpoint=self.endpoint)
+            raise CircuitOpenError(f'HH.ru временно недоступен ({self.endpoint}), повторите позже')
+
+    def record_success(self):
+        if self.failures:
+            with self._lock:
+                self.failures = 0
+
+    # Ошибка запроса. probe — функция для повторения запроса в фоне, возвращает ответ HH.ru
+    def record_failure(self, probe):
+        with self._lock:
+            self.failures += 1
+            self._probe = probe
+            if self.state == OPEN or self.failures < self.failure_threshold:
+                return
+            self.state = OPEN
+            self.opened_at = time.time()
+            self.opened_total += 1
+        logger.warning("HH.ru не отвечает (%s): цепь разомкнута после %s ошибок подряд", self.endpoint, self.failures)
+        threading.Thread(target=self._probe_loop, name='hh-breaker-probe', daemon=True).start()
+
+    def _close(self):
+        with self._lock:
+            opened_at = self.opened_at
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+        logger.warning("HH.ru снова отвечает (%s): цепь замкнута через %.0f с", self.endpoint, time.time() - opened_at)
+
+    def _probe_loop(self):
+        while self.state == OPEN:
+            time.sleep(self.reset_timeout)
+            try:
+                response = self._probe()
+            except requests.RequestException as e:
+                logger.info("Пробный запрос к HH.ru (%s) не удался: %s", self.endpoint, e)
+                continue
+            if response.status_code < 500:
+                self._close()
+            else:
+                logger.info("Пробный запрос к HH.ru (%s): ответ %s", self.endpoint, response.status_code)
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'opened_at': self.opened_at,
+            'opened_total': self.opened_total
+        }
+
+
+_breakers = {}
+_breakers_pid = None
+_breakers_lock = threading.Lock()
+
+
+# Выключатель адреса. После fork (воркеры gunicorn) создаются заново:
+# фоновые потоки проверки родителя в дочернем процессе не работают.
+def get_breaker(endpoint):
+    global _breakers, _breakers_pid
+    pid = os.getpid()
+    breaker = _breakers.get(endpoint) if _breakers_pid == pid else None
+    if breaker is None:
+        with _breakers_lock:
+            if _breakers_pid != pid:
+                _breakers = {}
+                _breakers_pid = pid
+            breaker = _breakers.setdefault(endpoint, CircuitBreaker(endpoint))
+    return breaker
+
+
+# Разомкнута ли цепь адреса (без создания выключателя)
+def is_open(endpoint):
+    breaker = _breakers.get(endpoint) if _breakers_pid == os.getpid() else None
+    return breaker is not None and breaker.is_open()
+
+
+# Состояние выключателей процесса: {адрес: stats()}
+def get_breaker_stats():
+    if _breakers_pid != os.getpid():
+        return {}
+    return {endpoint: breaker.stats() for endpoint, breaker in list(_breakers.items())}
+
+
+# Состояние цепей для /metrics
+def _collect_metrics():
+    stats = get_breaker_stats()
+    return [
+        ('hh_circuit_open', 'gauge', 'Разомкнута ли цепь запросов к адресу HH.ru (1 — запросы не отправляются)',
+         [({'endpoint': endpoint}, 1 if item['state'] == OPEN else 0) for endpoint, item in stats.items()]),
+        ('hh_circuit_opened_total', 'counter', 'Сколько раз цепь размыкалась',
+         [({'endpoint': endpoint}, item['opened_total']) for endpoint, item in stats.items()])
+    ]
+
+
+metrics.register_collector(_collect_metrics)
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import metrics
+from logging_setup import bind_context
+
+logger = logging.getLogger(__name__)
+
+# Настройки кеша
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')  # memory или redis
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1024'))
+IDENTITY_CACHE_TTL = int(os.getenv('IDENTITY_CACHE_TTL', '3600'))  # секунды
+LIMITS_FRESH_TTL = int(os.getenv('LIMITS_FRESH_TTL', '60'))  # сколько секунд лимиты считаются свежими
+LIMITS_STALE_TTL = int(os.getenv('LIMITS_STALE_TTL', '900'))  # сколько секунд можно отдавать устаревшие лимиты
+LIMITS_LAST_KNOWN_TTL = int(os.getenv('LIMITS_LAST_KNOWN_TTL', '86400'))  # сколько секунд хранятся последние известные лимиты на случай недоступности HH.ru
+
+
+# Интерфейс хранилища кеша. Значения должны сериализоваться в JSON,
+# чтобы их можно было хранить во внешнем (общем для процессов) хранилище.
+class CacheBackend:
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+# LRU-кеш в памяти процесса с ограничением времени жизни записей
+class MemoryBackend(CacheBackend):
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Хранилище в Redis, общее для всех воркеров (требует пакет redis)
+class RedisBackend(CacheBackend):
+    def __init__(self, url=CACHE_REDIS_URL):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(key, json.dumps(value, ensure_ascii=False), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self._client.delete(key)
+
+    def clear(self):
+        for key in self._client.scan_iter('hh_limits:*'):
+            self._client.delete(key)
+
+
+def create_backend(name=None):
+    name = name or CACHE_BACKEND
+    if name == 'redis':
+        try:
+            return RedisBackend()
+        except Exception as e:
+            logger.error("Не удалось подключиться к Redis, используется кеш в памяти: %s", e)
+    return MemoryBackend()
+
+
+# Именованный кеш поверх хранилища со счетчиками попаданий и промахов
+class TTLCache:
+    def __init__(self, name, ttl, backend=None):
+        self.name = name
+        self.ttl = ttl
+        self.backend = backend or create_backend()
+        self.hits = 0
+        self.misses = 0
+        _registry[name] = self
+
+    def _key(self, key):
+        return f'hh_limits:{self.name}:{key}'
+
+    def get(self, key):
+        value = self.backend.get(self._key(key))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(self._key(key), value, ttl if ttl is not None else self.ttl)
+
+    def invalidate(self, key):
+        self.backend.delete(self._key(key))
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': getattr(self.backend, 'evictions', 0)
+        }
+
+
+# Кеш с семантикой stale-while-revalidate и объединением запросов:
+# - свежее значение отдается сразу;
+# - устаревшее значение тоже отдается сразу, а обновление запускается в фоне;
+# - при отсутствии значения загрузка выполняется синхронно, причем
+#   одновременные запросы одного ключа ждут единственный вызов loader.
+class StaleWhileRevalidateCache:
+    def __init__(self, name, fresh_ttl, stale_ttl, backend=None, max_background=2, keep_ttl=0):
+        self.name = name
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = max(stale_ttl, fresh_ttl)
+        # Запись хранится дольше stale_ttl (но не отдается get_or_load), чтобы
+        # last_known мог вернуть последнее значение, когда источник недоступен
+        self.keep_ttl = max(keep_ttl, self.stale_ttl)
+        self.backend = backend or create_backend()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_background, thread_name_prefix=f'{name}-refresh')
+        _registry[name] = self
+
+    def _key(self, key):
+        return f'hh_limits:{self.name}:{key}'
+
+    # Загрузка значения с объединением одновременных запросов.
+    # Возвращает Future и признак того, что вызывающий стал ведущим.
+    def _start_load(self, key):
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+            return future, True
+
+    def _run_load(self, key, future, loader, should_cache):
+        try:
+            value = loader()
+            if should_cache(value):
+                self.backend.set(self._key(key), {'value': value, 'fetched_at': time.time()}, self.keep_ttl)
+            future.set_result(value)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def get_or_load(self, key, loader, should_cache=lambda value: value is not None):
+        entry = self.backend.get(self._key(key))
+        if entry is not None:
+            age = time.time() - entry['fetched_at']
+            if age < self.fresh_ttl:
+                self.hits += 1
+                return entry['value']
+            if age < self.stale_ttl:
+                self.stale_hits += 1
+                future, leader = self._start_load(key)
+                if leader:
+                    self._executor.submit(bind_context(self._run_load, key, future, loader, should_cache))
+                return entry['value']
+
+        self.misses += 1
+        future, leader = self._start_load(key)
+        if leader:
+            self._run_load(key, future, loader, should_cache)
+        return future.result()
+
+    # Время получения закешированного значения (UNIX time) или None
+    def fetched_at(self, key):
+        entry = self.backend.get(self._key(key))
+        if entry is None or time.time() - entry['fetched_at'] >= self.stale_ttl:
+            return None
+        return entry['fetched_at']
+
+    # Последнее полученное значение любой давности (до keep_ttl): {'value', 'fetched_at'} или None
+    def last_known(self, key):
+        return self.backend.get(self._key(key))
+
+    def invalidate(self, key):
+        self.backend.delete(self._key(key))
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': getattr(self.backend, 'evictions', 0)
+        }
+
+
+_registry = {}
+
+
+# Статистика всех созданных кешей процесса
+def get_cache_stats():
+    return {name: cache.stats() for name, cache in _registry.items()}
+
+
+# Счетчики кешей для /metrics: hits, stale_hits, misses, coalesced, evictions
+def _collect_metrics():
+    samples = [
+        ({'cache': name, 'event': event}, value)
+        for name, stats in get_cache_stats().items()
+        for event, value in stats.items()
+    ]
+    return [('hh_cache_events_total', 'counter', 'События кешей по типу', samples)]
+
+
+metrics.register_collector(_collect_metrics)
+
+
+# Ключ кеша для токена: сам токен в ключе не хранится
+def token_key(access_token):
+    return hashlib.sha256(access_token.encode('utf-8')).hexdigest()[:32]
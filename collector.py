@@ -0,0 +1,76 @@
+import os
+import time
+import random
+import logging
+import hh_client
+import metrics
+from fetcher import fetch_all_limits
+
+logger = logging.getLogger(__name__)
+
+# Настройки сборщика снимков лимитов
+COLLECT_INTERVAL = int(os.getenv('COLLECT_INTERVAL', '900'))  # секунды между обходами
+COLLECT_JITTER = float(os.getenv('COLLECT_JITTER', '0.1'))  # случайное отклонение интервала (доля)
+COLLECT_MAX_BACKOFF = int(os.getenv('COLLECT_MAX_BACKOFF', '3600'))  # максимальная пауза после ошибок
+
+# Метрики сборщика (записываются в METRICS_TEXTFILE после каждого обхода)
+CYCLES = metrics.Counter('hh_collector_cycles_total', 'Обходы сборщика по результату', ('result',))
+CYCLE_DURATION = metrics.Gauge('hh_collector_cycle_duration_seconds', 'Длительность последнего обхода')
+LAST_SUCCESS = metrics.Gauge('hh_collector_last_success_timestamp_seconds', 'Время последнего успешного обхода (UNIX time)')
+
+
+# Один обход: лимиты всех менеджеров сохраняются одним снимком, вместе со снимком
+# обновляются сводки менеджеров, а правила оповещений (alerts.py) проверяются
+# только для менеджеров, лимиты которых изменились
+def collect_once(employer_id, managers, fetch_limits, store, alerter=None):
+    results = fetch_all_limits(employer_id, managers, fetch_limits)
+    _, changes = store.record_snapshot(employer_id, results)
+    if alerter is not None and changes:
+        alerter.process(employer_id, changes)
+    return results
+
+
+# Пауза до следующего обхода: интервал со случайным отклонением, удвоение после
+# неудачных обходов и ожидание окончания ограничения частоты запросов (429)
+def next_delay(interval, jitter, failures):
+    delay = min(interval * (2 ** failures), max(interval, COLLECT_MAX_BACKOFF))
+    delay *= 1 + random.uniform(-jitter, jitter)
+    throttled_until = hh_client.throttled_until()
+    if throttled_until:
+        delay = max(delay, throttled_until - time.time())
+    return max(0.0, delay)
+
+
+# Долгоживущий цикл сбора снимков.
+# get_context() вызывается перед каждым обходом (в нем можно обновить токен)
+# и возвращает (employer_id, managers, fetch_limits).
+def run_collector(get_context, store, interval=COLLECT_INTERVAL, jitter=COLLECT_JITTER, max_cycles=None, alerter=None):
+    failures = 0
+    cycle = 0
+    while max_cycles is None or cycle < max_cycles:
+        cycle += 1
+        started = time.time()
+        try:
+            employer_id, managers, fetch_limits = get_context()
+            results = collect_once(employer_id, managers, fetch_limits, store, alerter)
+            failed = sum(1 for item in results if item['error'])
+            logger.info("Снимок лимитов сохранен: менеджеров %s, ошибок %s, за %.1f с", len(results), failed, time.time() - started)
+            # Обход считается неудачным, если не удалось получить лимиты ни одного менеджера
+            failures = failures + 1 if results and failed == len(results) else 0
+        except Exception as e:
+            failures += 1
+            logger.error("Ошибка при сборе снимка лимитов: %s", e)
+
+        CYCLE_DURATION.set(time.time() - started)
+        if failures:
+            CYCLES.inc(result='failed')
+        else:
+            CYCLES.inc(result='ok')
+            LAST_SUCCESS.set(time.time())
+        metrics.write_textfile()
+
+        if max_cycles is not None and cycle >= max_cycles:
+            break
+        delay = next_delay(interval, jitter, failures)
+        logger.info("Следующий обход через %.0f с", delay)
+        time.sleep(delay)
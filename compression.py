@@ -0,0 +1,117 @@
+import os
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli не установлен: только gzip
+    brotli = None
+
+# Сжатие ответов веб-приложения (gzip или brotli по заголовку Accept-Encoding)
+COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', '1') != '0'
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))  # ответы меньше этого размера не сжимаются, байты
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))  # уровень gzip, 1-9
+COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', '4'))  # качество brotli, 0-11
+
+COMPRESSIBLE_TYPES = {
+    'text/html',
+    'text/plain',
+    'text/csv',
+    'application/json',
+    'application/x-ndjson'
+}
+
+
+class _GzipCompressor:
+    def __init__(self):
+        self._compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    # Часть потока: сбрасывается сразу, чтобы клиент получил строку без ожидания конца ответа
+    def chunk(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+
+    def chunk(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+# Кодирование ответа по Accept-Encoding: br (если установлен brotli), gzip или None
+def choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br'] > 0 and accepted['br'] >= accepted['gzip']:
+        return 'br'
+    if accepted['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+# ETag из If-None-Match, совпадающий с etag без сжатия или с суффиксом кодирования, иначе None
+def matching_etag(etag):
+    for candidate in (etag, f'{etag}-gzip', f'{etag}-br'):
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def _compressor(encoding):
+    return _BrotliCompressor() if encoding == 'br' else _GzipCompressor()
+
+
+# Сжатие потокового ответа по частям: строки NDJSON и CSV по-прежнему
+# доходят до клиента по мере получения данных
+def _compress_stream(chunks, compressor):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield compressor.chunk(chunk)
+        yield compressor.finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+# Обработчик after_request. У сжатого ответа свой ETag (суффикс кодирования),
+# поэтому повторный запрос с этим ETag в If-None-Match получает 304 без сжатия.
+def compress_response(response):
+    if not COMPRESS_ENABLED or response.status_code != 200 or response.direct_passthrough:
+        return response
+    if response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    if not response.is_streamed and response.calculate_content_length() < COMPRESS_MIN_SIZE:
+        return response
+
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+        if request.if_none_match.contains_raw(response.headers['ETag']):
+            response.status_code = 304
+            response.response = []
+            for header in ('Content-Length', 'Content-Type', 'Content-Disposition'):
+                response.headers.pop(header, None)
+            return response
+
+    compressor = _compressor(encoding)
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, compressor)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compressor.chunk(response.get_data()) + compressor.finish())
+    response.headers['Content-Encoding'] = encoding
+    return response
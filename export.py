@@ -0,0 +1,129 @@
+import io
+import os
+import csv
+import json
+import time
+
+# Поддерживаемые форматы выгрузки
+FORMATS = ('ndjson', 'csv')
+
+# Колонки CSV: служебные поля и плоские поля ответа /limits/resume
+CSV_FIELDS = [
+    'manager_id',
+    'manager_name',
+    'fetched_at',
+    'error',
+    'limits.resume_view',
+    'spend.resume_view',
+    'left.resume_view'
+]
+# Колонки сводной выгрузки по нескольким аккаунтам (python get.py batch)
+BATCH_CSV_FIELDS = ['account', 'employer_id'] + CSV_FIELDS
+
+
+# Преобразование вложенного ответа /limits/resume в плоский словарь:
+# {'left': {'resume_view': 5}} -> {'left.resume_view': 5}
+def flatten_limits(limits, prefix=''):
+    flat = {}
+    if not isinstance(limits, dict):
+        return flat
+    for key, value in limits.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten_limits(value, f'{name}.'))
+        else:
+            flat[name] = value
+    return flat
+
+
+# Запись выгрузки для одного менеджера
+def make_record(item, fetched_at=None):
+    return {
+        'manager_id': item['manager_id'],
+        'manager_name': item['manager_name'],
+        'fetched_at': fetched_at or time.time(),
+        'error': item['error'],
+        'limits': item['limits']
+    }
+
+
+# Одна строка NDJSON (компактный JSON без отступов)
+def format_ndjson(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+# Строка CSV с заголовком или данными
+def _csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def format_csv_header(fields=CSV_FIELDS):
+    return _csv_line(fields)
+
+
+def format_csv(record, fields=CSV_FIELDS):
+    flat = flatten_limits(record['limits'])
+    flat.update({key: value for key, value in record.items() if key != 'limits'})
+    return _csv_line(['' if flat.get(field) is None else flat[field] for field in fields])
+
+
+def format_record(record, fmt):
+    return format_ndjson(record) if fmt == 'ndjson' else format_csv(record)
+
+
+# Потоковая выгрузка для HTTP-ответа: строки выдаются по мере получения данных
+def stream_records(results, fmt):
+    if fmt == 'csv':
+        yield format_csv_header()
+    for item in results:
+        yield format_record(make_record(item), fmt)
+
+
+# Удаление оборванной последней строки после аварийного завершения
+def _truncate_partial_line(path):
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+# ID менеджеров, уже успешно записанных в файл выгрузки (для продолжения прерванного
+# запуска). Менеджеры с ошибкой запрашиваются повторно, новая строка дописывается в конец.
+# Последняя строка, оборванная при падении, удаляется и будет записана заново.
+def read_written_ids(path, fmt):
+    written = set()
+    if not os.path.exists(path):
+        return written
+    _truncate_partial_line(path)
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if fmt == 'ndjson':
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get('manager_id') and not record.get('error'):
+                    written.add(str(record['manager_id']))
+        else:
+            for row in csv.DictReader(f):
+                if row.get('manager_id') and not row.get('error'):
+                    written.add(row['manager_id'])
+    return written
+
+
+# Запись результатов в файл по мере поступления. Каждая строка сбрасывается
+# на диск сразу, поэтому при падении сохраняется все, что уже получено.
+# Возвращает количество записанных менеджеров.
+def write_export(path, results, fmt):
+    exists = os.path.exists(path) and os.path.getsize(path) > 0
+    written = 0
+    with open(path, 'a', encoding='utf-8', newline='') as f:
+        if fmt == 'csv' and not exists:
+            f.write(format_csv_header())
+        for item in results:
+            f.write(format_record(make_record(item), fmt))
+            f.flush()
+            written += 1
+    return written
@@ -0,0 +1,76 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import metrics
+from logging_setup import bind_context
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество одновременных запросов к API HH.ru
+FETCH_MAX_WORKERS = int(os.getenv('FETCH_MAX_WORKERS', '8'))
+
+NO_DATA_MESSAGE = 'Нет данных или доступ запрещен.'
+
+metrics.Gauge('hh_fetch_max_workers', 'Максимум одновременных запросов лимитов').set(FETCH_MAX_WORKERS)
+
+
+# Получение лимитов одного менеджера с перехватом любых ошибок,
+# чтобы сбой одного запроса не прерывал весь пакет
+def _fetch_one(fetch_limits, employer_id, manager):
+    manager_id = manager.get('id')
+    result = {
+        'manager_id': manager_id,
+        'manager_name': manager.get('full_name') or 'Без имени',
+        'limits': None,
+        'error': None
+    }
+    metrics.FETCH_IN_PROGRESS.inc()
+    try:
+        limits = fetch_limits(employer_id, manager_id)
+    except Exception as e:
+        logger.error("Ошибка при получении лимитов для менеджера (ID: %s): %s", manager_id, e)
+        result['error'] = str(e)
+        return result
+    finally:
+        metrics.FETCH_IN_PROGRESS.dec()
+
+    if isinstance(limits, dict):
+        result['limits'] = limits
+    elif isinstance(limits, str):
+        result['error'] = limits
+    else:
+        result['error'] = NO_DATA_MESSAGE
+    return result
+
+
+# Параллельное получение лимитов для списка менеджеров.
+# fetch_limits(employer_id, manager_id) возвращает dict с лимитами,
+# строку с описанием ошибки или None. Порядок результатов совпадает
+# с порядком менеджеров во входном списке.
+def fetch_all_limits(employer_id, managers, fetch_limits, max_workers=None):
+    managers = [m for m in managers if m.get('id')]
+    if not managers:
+        return []
+
+    max_workers = max(1, min(max_workers or FETCH_MAX_WORKERS, len(managers)))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hh-fetch') as executor:
+        tasks = [bind_context(_fetch_one, fetch_limits, employer_id, m) for m in managers]
+        return list(executor.map(lambda task: task(), tasks))
+
+
+# Потоковое получение лимитов: результаты выдаются по мере готовности
+# (в порядке завершения запросов, а не в порядке входного списка).
+# Если потребитель прекращает чтение, еще не начатые запросы отменяются.
+def iter_limits(employer_id, managers, fetch_limits, max_workers=None):
+    managers = [m for m in managers if m.get('id')]
+    if not managers:
+        return
+
+    max_workers = max(1, min(max_workers or FETCH_MAX_WORKERS, len(managers)))
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hh-fetch')
+    try:
+        futures = [executor.submit(bind_context(_fetch_one, fetch_limits, employer_id, m)) for m in managers]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
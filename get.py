@@ -1,24 +1,48 @@
-import requests
 import os
+import time
+import argparse
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, timezone
 import json
-import webbrowser
 
-# Загрузка переменных из .env файла
+# Модули проекта читают настройки из окружения при импорте, поэтому .env
+# загружается до них (уже заданные переменные окружения не перезаписываются)
 load_dotenv()
 
-CLIENT_ID = os.getenv('CLIENT_ID')
-CLIENT_SECRET = os.getenv('CLIENT_SECRET')
-REDIRECT_URI = os.getenv('REDIRECT_URI')
-REFRESH_TOKEN = os.getenv('REFRESH_TOKEN')
-ACCESS_TOKEN = os.getenv('ACCESS_TOKEN')
-ACCESS_TOKEN_EXPIRES_AT = os.getenv('ACCESS_TOKEN_EXPIRES_AT')
+import hh_client
+import metrics
+from hh_client import API_URL, OAUTH_URL
+from tokens import TokenManager, EnvTokenFile, parse_expires_at
 
-# Проверка наличия необходимых переменных
-if not all([CLIENT_ID, CLIENT_SECRET, REDIRECT_URI]):
-    print('Ошибка: Пожалуйста, убедитесь, что CLIENT_ID, CLIENT_SECRET и REDIRECT_URI заданы в файле .env')
-    exit()
+# Учетные данные и токены (заполняются в load_config при запуске команды;
+# импорт модуля ничего не проверяет и не запрашивает)
+CLIENT_ID = None
+CLIENT_SECRET = None
+REDIRECT_URI = None
+REFRESH_TOKEN = None
+ACCESS_TOKEN = None
+ACCESS_TOKEN_EXPIRES_AT = None
+USER_AGENT = 'Wendy 4.0/1.0 (shishenya.ya@professionals4-0.ru)'
+
+# Файл .env, в котором хранятся токены
+env_file = EnvTokenFile('.env')
+
+# Чтение переменных (из окружения и .env) и проверка наличия необходимых переменных
+def load_config():
+    global CLIENT_ID, CLIENT_SECRET, REDIRECT_URI, REFRESH_TOKEN, ACCESS_TOKEN, ACCESS_TOKEN_EXPIRES_AT
+    CLIENT_ID = os.getenv('CLIENT_ID')
+    CLIENT_SECRET = os.getenv('CLIENT_SECRET')
+    REDIRECT_URI = os.getenv('REDIRECT_URI')
+    REFRESH_TOKEN = os.getenv('REFRESH_TOKEN')
+    ACCESS_TOKEN = os.getenv('ACCESS_TOKEN')
+    ACCESS_TOKEN_EXPIRES_AT = os.getenv('ACCESS_TOKEN_EXPIRES_AT')
+    if not all([CLIENT_ID, CLIENT_SECRET, REDIRECT_URI]):
+        print('Ошибка: Пожалуйста, убедитесь, что CLIENT_ID, CLIENT_SECRET и REDIRECT_URI заданы в файле .env')
+        exit()
+
+# Ошибка ответа API HH.ru
+class HHApiError(Exception):
+    pass
 
 # Функция для получения текущего времени в UTC
 def current_time():
@@ -26,7 +50,7 @@ def current_time():
 
 # Функция для получения нового access_token с использованием authorization_code
 def get_access_token_from_code(code):
-    token_url = 'https://hh.ru/oauth/token'
+    token_url = f'{OAUTH_URL}/oauth/token'
     token_data = {
         'grant_type': 'authorization_code',
         'client_id': CLIENT_ID,
@@ -35,7 +59,7 @@ def get_access_token_from_code(code):
         'redirect_uri': REDIRECT_URI
     }
 
-    response = requests.post(token_url, data=token_data)
+    response = hh_client.post(token_url, data=token_data)
     if response.status_code == 200:
         token_info = response.json()
         return token_info
@@ -45,152 +69,138 @@ def get_access_token_from_code(code):
         exit()
 
 # Функция для обновления access_token с использованием refresh_token
-def refresh_access_token():
-    token_url = 'https://hh.ru/oauth/token'
+def refresh_access_token(refresh_token=None):
+    token_url = f'{OAUTH_URL}/oauth/token'
     token_data = {
         'grant_type': 'refresh_token',
-        'refresh_token': REFRESH_TOKEN,
+        'refresh_token': refresh_token or REFRESH_TOKEN,
         'client_id': CLIENT_ID,
         'client_secret': CLIENT_SECRET
     }
 
-    response = requests.post(token_url, data=token_data)
+    response = hh_client.post(token_url, data=token_data)
     if response.status_code == 200:
         token_info = response.json()
         return token_info
     else:
-        print(f'Ошибка при обновлении токена доступа: {response.status_code}')
-        print(response.text)
-        exit()
+        raise HHApiError(f'Ошибка при обновлении токена доступа: {response.status_code}\n{response.text}')
 
-# Проверяем, требуется ли обновление access_token
+# Обновление токена через TokenManager: одновременные запуски с одним
+# refresh_token получают результат одного обновления
+token_manager = TokenManager(refresh_access_token)
+
+# Проверяем, требуется ли обновление access_token (заранее, за TOKEN_REFRESH_MARGIN секунд)
 def is_token_expired():
     if not ACCESS_TOKEN or not ACCESS_TOKEN_EXPIRES_AT:
         return True
-    expires_at = datetime.strptime(ACCESS_TOKEN_EXPIRES_AT, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
-    return current_time() >= expires_at
+    return token_manager.needs_refresh(parse_expires_at(ACCESS_TOKEN_EXPIRES_AT))
 
-# Функция для сохранения переменных в .env файл
+# Функция для сохранения переменных в .env файл (атомарно, вызывается под env_file.locked())
 def update_env_file(new_vars):
-    with open('.env', 'r') as file:
-        env_vars = file.readlines()
-
-    with open('.env', 'w') as file:
-        updated_keys = set(new_vars.keys())
-        for line in env_vars:
-            key = line.strip().split('=')[0]
-            if key in updated_keys:
-                continue  # Пропускаем переменные, которые будем обновлять
-            file.write(line)
-        for key, value in new_vars.items():
-            file.write(f'{key}={value}\n')
-
-# Если access_token истёк или отсутствует, обновляем его
-if is_token_expired():
-    if REFRESH_TOKEN:
-        # Обновляем access_token с использованием refresh_token
-        token_info = refresh_access_token()
-        ACCESS_TOKEN = token_info['access_token']
-        REFRESH_TOKEN = token_info.get('refresh_token', REFRESH_TOKEN)
-        expires_in = token_info.get('expires_in', 3600)  # По умолчанию 1 час
-        expires_at = current_time() + timedelta(seconds=expires_in)
-        ACCESS_TOKEN_EXPIRES_AT = expires_at.strftime('%Y-%m-%d %H:%M:%S')
-
-        # Обновляем переменные в .env файле
-        update_env_file({
-            'ACCESS_TOKEN': ACCESS_TOKEN,
-            'REFRESH_TOKEN': REFRESH_TOKEN,
-            'ACCESS_TOKEN_EXPIRES_AT': ACCESS_TOKEN_EXPIRES_AT
-        })
-        print('ACCESS_TOKEN обновлен и сохранен в .env файл')
+    env_file.update(new_vars)
+
+# Сохранение новых токенов в памяти процесса и в .env
+def save_tokens(access_token, refresh_token, expires_at):
+    global ACCESS_TOKEN, REFRESH_TOKEN, ACCESS_TOKEN_EXPIRES_AT
+    ACCESS_TOKEN = access_token
+    REFRESH_TOKEN = refresh_token
+    ACCESS_TOKEN_EXPIRES_AT = datetime.fromtimestamp(expires_at, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    update_env_file({
+        'ACCESS_TOKEN': ACCESS_TOKEN,
+        'REFRESH_TOKEN': REFRESH_TOKEN,
+        'ACCESS_TOKEN_EXPIRES_AT': ACCESS_TOKEN_EXPIRES_AT
+    })
+
+# Если access_token истёк или отсутствует, обновляем его. Пока токен действует,
+# используется значение в памяти процесса без обращения к файлу и к HH.ru.
+# Обновление выполняется под блокировкой .env: сначала перечитываются токены,
+# которые мог сохранить другой запуск, и только если они тоже устарели,
+# выполняется запрос к HH.ru.
+def ensure_access_token():
+    global ACCESS_TOKEN, REFRESH_TOKEN, ACCESS_TOKEN_EXPIRES_AT, headers
+    if is_token_expired():
+        with env_file.locked():
+            saved = env_file.read()
+            ACCESS_TOKEN = saved.get('ACCESS_TOKEN') or ACCESS_TOKEN
+            REFRESH_TOKEN = saved.get('REFRESH_TOKEN') or REFRESH_TOKEN
+            ACCESS_TOKEN_EXPIRES_AT = saved.get('ACCESS_TOKEN_EXPIRES_AT') or ACCESS_TOKEN_EXPIRES_AT
+            if not is_token_expired():
+                print('Используется ACCESS_TOKEN, обновленный другим запуском')
+            elif REFRESH_TOKEN:
+                # Обновляем access_token с использованием refresh_token
+                token_info = token_manager.refresh(REFRESH_TOKEN)
+                save_tokens(token_info['access_token'], token_info['refresh_token'], token_info['expires_at'])
+                print('ACCESS_TOKEN обновлен и сохранен в .env файл')
+
+            else:
+                # Получаем authorization_code вручную
+                print('Необходимо получить authorization_code для получения ACCESS_TOKEN')
+                auth_url = f'{OAUTH_URL}/oauth/authorize?response_type=code&client_id={CLIENT_ID}&redirect_uri={REDIRECT_URI}&scope=employer'
+                print(f'Откройте в браузере следующую ссылку и авторизуйтесь: {auth_url}')
+                import webbrowser
+                webbrowser.open(auth_url)
+                authorization_code = input('После авторизации введите параметр "code" из адресной строки: ')
+
+                # Получаем access_token и refresh_token
+                token_info = get_access_token_from_code(authorization_code)
+                expires_in = token_info.get('expires_in', 3600)  # По умолчанию 1 час
+                save_tokens(token_info['access_token'], token_info.get('refresh_token', ''),
+                            (current_time() + timedelta(seconds=expires_in)).timestamp())
+                print('ACCESS_TOKEN и REFRESH_TOKEN сохранены в .env файл')
+
+    # Заголовки для запросов к API
+    headers = {
+        'Authorization': f'Bearer {ACCESS_TOKEN}',
+        'User-Agent': USER_AGENT,
+        'Accept': 'application/json'
+    }
+
+# Заголовки для запросов к API (заполняются в ensure_access_token)
+headers = {}
 
-    else:
-        # Получаем authorization_code вручную
-        print('Необходимо получить authorization_code для получения ACCESS_TOKEN')
-        auth_url = f'https://hh.ru/oauth/authorize?response_type=code&client_id={CLIENT_ID}&redirect_uri={REDIRECT_URI}&scope=employer'
-        print(f'Откройте в браузере следующую ссылку и авторизуйтесь: {auth_url}')
-        webbrowser.open(auth_url)
-        authorization_code = input('После авторизации введите параметр "code" из адресной строки: ')
-
-        # Получаем access_token и refresh_token
-        token_info = get_access_token_from_code(authorization_code)
-        ACCESS_TOKEN = token_info['access_token']
-        REFRESH_TOKEN = token_info.get('refresh_token', '')
-        expires_in = token_info.get('expires_in', 3600)  # По умолчанию 1 час
-        expires_at = current_time() + timedelta(seconds=expires_in)
-        ACCESS_TOKEN_EXPIRES_AT = expires_at.strftime('%Y-%m-%d %H:%M:%S')
-
-        # Сохраняем переменные в .env файл
-        update_env_file({
-            'ACCESS_TOKEN': ACCESS_TOKEN,
-            'REFRESH_TOKEN': REFRESH_TOKEN,
-            'ACCESS_TOKEN_EXPIRES_AT': ACCESS_TOKEN_EXPIRES_AT
-        })
-        print('ACCESS_TOKEN и REFRESH_TOKEN сохранены в .env файл')
-
-# Заголовки для запросов к API
-headers = {
-    'Authorization': f'Bearer {ACCESS_TOKEN}',
-    'User-Agent': 'Wendy 4.0/1.0 (shishenya.ya@professionals4-0.ru)',
-    'Accept': 'application/json'
-}
 
 # Функция для получения информации о текущем пользователе
 def get_current_user_info():
-    url = 'https://api.hh.ru/me'
-    response = requests.get(url, headers=headers)
+    url = f'{API_URL}/me'
+    response = hh_client.get(url, headers=headers)
     if response.status_code == 200:
         user_info = response.json()
         return user_info
     else:
-        print(f'Ошибка при получении информации о пользователе: {response.status_code}')
-        print(response.text)
-        exit()
-
-# Получение информации о текущем пользователе
-user_info = get_current_user_info()
-
-# Добавляем отладочный вывод
-print("Ответ от /me:", json.dumps(user_info, ensure_ascii=False, indent=4))
+        raise HHApiError(f'Ошибка при получении информации о пользователе: {response.status_code}\n{response.text}')
 
 # Получение EMPLOYER_ID из информации о пользователе
-employer = user_info.get('employer')
-if employer and 'id' in employer:
-    EMPLOYER_ID = employer['id']
-    print(f'EMPLOYER_ID: {EMPLOYER_ID}')
-else:
-    print('Ошибка: Не удалось получить EMPLOYER_ID из информации о пользователе.')
-    print("Полный ответ от /me:", json.dumps(user_info, ensure_ascii=False, indent=4))
-    exit()
+def get_employer_id(user_info):
+    employer = user_info.get('employer')
+    if employer and 'id' in employer:
+        return employer['id']
+    raise HHApiError(
+        'Ошибка: Не удалось получить EMPLOYER_ID из информации о пользователе.\n'
+        f'Полный ответ от /me: {json.dumps(user_info, ensure_ascii=False, indent=4)}'
+    )
 
-# Функция для получения списка менеджеров
+# Функция для получения списка менеджеров: все страницы, условные запросы
+# и локальный справочник
 def get_managers(employer_id):
-    url = f'https://api.hh.ru/employers/{employer_id}/managers'
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        managers_info = response.json()
-        return managers_info.get('items', [])
-    else:
-        print(f'Ошибка при получении списка менеджеров: {response.status_code}')
-        print(response.text)
-        exit()
+    from managers import ManagerDirectory, ManagerSyncError
 
-# Получение списка менеджеров
-managers = get_managers(EMPLOYER_ID)
-
-# Проверка наличия менеджеров
-if not managers:
-    print('Не найдено ни одного менеджера.')
-    exit()
+    directory = ManagerDirectory(employer_id)
+    try:
+        managers = directory.sync(headers)
+    except ManagerSyncError as e:
+        raise HHApiError(str(e))
+    if directory.changed or directory.removed:
+        print(f'Справочник менеджеров: новых или измененных {len(directory.changed)}, удаленных {len(directory.removed)}')
+    return managers
 
 # Функция для получения лимитов просмотра резюме для менеджера
 def get_resume_view_limits(employer_id, manager_id, locale='RU', host='hh.ru'):
-    url = f'https://api.hh.ru/employers/{employer_id}/managers/{manager_id}/limits/resume'
+    url = f'{API_URL}/employers/{employer_id}/managers/{manager_id}/limits/resume'
     params = {
         'locale': locale,
         'host': host
     }
-    response = requests.get(url, headers=headers, params=params)
+    response = hh_client.get(url, headers=headers, params=params)
     if response.status_code == 200:
         return response.json()
     else:
@@ -198,43 +208,232 @@ def get_resume_view_limits(employer_id, manager_id, locale='RU', host='hh.ru'):
         print(response.text)
         return None
 
-# Получение текущей даты и времени для имени файла
-timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-filename = f'manager_limits_{timestamp}.txt'
-
-# Сбор данных о лимитах менеджеров
-manager_limits = []
-
-for manager in managers:
-    manager_id = manager.get('id')
-    manager_name = manager.get('full_name')
-    if not manager_id:
-        continue
-
-    # Получаем лимиты просмотра резюме для менеджера
-    limits = get_resume_view_limits(EMPLOYER_ID, manager_id)
-    if limits:
-        manager_limits.append({
-            'manager_id': manager_id,
-            'manager_name': manager_name,
-            'limits': limits
-        })
-
-# Вывод и сохранение данных
-if manager_limits:
-    # Вывод в консоль
-    for item in manager_limits:
-        print(f"\nМенеджер: {item['manager_name']} (ID: {item['manager_id']})")
-        print('Лимиты и использованные просмотры:')
-        print(json.dumps(item['limits'], ensure_ascii=False, indent=4))
-
-    # Сохранение в файл
-    with open(filename, 'w', encoding='utf-8') as f:
+# Разовая выгрузка лимитов всех менеджеров в текстовый файл
+def dump_limits():
+    from fetcher import fetch_all_limits
+
+    ensure_access_token()
+
+    # Получение информации о текущем пользователе
+    user_info = get_current_user_info()
+
+    # Добавляем отладочный вывод
+    print("Ответ от /me:", json.dumps(user_info, ensure_ascii=False, indent=4))
+
+    EMPLOYER_ID = get_employer_id(user_info)
+    print(f'EMPLOYER_ID: {EMPLOYER_ID}')
+
+    # Получение списка менеджеров
+    managers = get_managers(EMPLOYER_ID)
+
+    # Проверка наличия менеджеров
+    if not managers:
+        print('Не найдено ни одного менеджера.')
+        return
+
+    # Получение текущей даты и времени для имени файла
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f'manager_limits_{timestamp}.txt'
+
+    # Сбор данных о лимитах менеджеров (параллельно, с сохранением порядка)
+    results = fetch_all_limits(EMPLOYER_ID, managers, get_resume_view_limits)
+    manager_limits = [item for item in results if item['limits']]
+    failed_managers = [item for item in results if item['error']]
+
+    # Вывод и сохранение данных
+    if manager_limits:
+        # Вывод в консоль
         for item in manager_limits:
-            f.write(f"Менеджер: {item['manager_name']} (ID: {item['manager_id']})\n")
-            f.write('Лимиты и использованные просмотры:\n')
-            f.write(json.dumps(item['limits'], ensure_ascii=False, indent=4))
-            f.write('\n\n')
-    print(f'\nДанные сохранены в файл {filename}')
-else:
-    print('Не удалось получить информацию о лимитах ни для одного менеджера.')
+            print(f"\nМенеджер: {item['manager_name']} (ID: {item['manager_id']})")
+            print('Лимиты и использованные просмотры:')
+            print(json.dumps(item['limits'], ensure_ascii=False, indent=4))
+
+        # Сохранение в файл
+        with open(filename, 'w', encoding='utf-8') as f:
+            for item in manager_limits:
+                f.write(f"Менеджер: {item['manager_name']} (ID: {item['manager_id']})\n")
+                f.write('Лимиты и использованные просмотры:\n')
+                f.write(json.dumps(item['limits'], ensure_ascii=False, indent=4))
+                f.write('\n\n')
+        print(f'\nДанные сохранены в файл {filename}')
+    else:
+        print('Не удалось получить информацию о лимитах ни для одного менеджера.')
+
+    # Отчет о менеджерах, для которых не удалось получить лимиты
+    if failed_managers:
+        print(f'\nНе удалось получить лимиты для {len(failed_managers)} менеджеров:')
+        for item in failed_managers:
+            print(f"  {item['manager_name']} (ID: {item['manager_id']}): {item['error']}")
+
+    # Статистика переиспользования HTTP-соединений
+    stats = hh_client.get_connection_stats()
+    print(f"\nHTTP-запросов: {stats['requests']}, новых соединений: {stats['new_connections']}, переиспользовано: {stats['reused_connections']}")
+    print_upstream_latency()
+
+# Сводка длительности запросов к HH.ru по адресам (metrics.py)
+def print_upstream_latency():
+    for labels, count, average in metrics.UPSTREAM_LATENCY.summary():
+        print(f"  {labels['method']} {labels['endpoint']} [{labels['status']}]: {count} запросов, в среднем {average * 1000:.0f} мс")
+
+# Постоянный сбор снимков лимитов всех менеджеров в локальную базу
+def collect_limits(interval, cycles=None):
+    from collector import run_collector
+    from snapshots import SnapshotStore
+    from alerts import Alerter
+    from logging_setup import setup_logging
+
+    # Сборщик пишет лог только в stdout: файл app.log принадлежит веб-приложению
+    setup_logging(log_file='')
+    store = SnapshotStore()
+    print(f'Сбор снимков лимитов в {store.path} каждые {interval} с')
+
+    # Перед каждым обходом проверяем токен и обновляем список менеджеров
+    def get_context():
+        ensure_access_token()
+        employer_id = get_employer_id(get_current_user_info())
+        return employer_id, get_managers(employer_id), get_resume_view_limits
+
+    run_collector(get_context, store, interval=interval, max_cycles=cycles, alerter=Alerter())
+
+# Прогноз исчерпания лимитов по истории снимков сборщика
+def print_forecast(employer_id=None):
+    from analytics import forecast_for_employer
+    from snapshots import open_existing_store
+
+    store = open_existing_store()
+    if store is None:
+        print('Нет истории лимитов: сначала запустите python get.py collect')
+        return
+
+    if not employer_id:
+        ensure_access_token()
+        employer_id = get_employer_id(get_current_user_info())
+
+    def format_time(timestamp):
+        try:
+            return datetime.fromtimestamp(timestamp).strftime('%d.%m.%Y %H:%M') if timestamp else '—'
+        except (ValueError, OverflowError, OSError):
+            return '—'
+
+    managers, summary = forecast_for_employer(store, employer_id)
+    print(f"Менеджеров: {summary['managers']}, осталось просмотров: {summary['total_left']}, "
+          f"расход в сутки: {summary['total_rate_per_day']:.1f}, исчерпание: {format_time(summary['exhaust_at'])}")
+    print(f"Исчерпают лимит до {format_time(summary['period_end'])}: {summary['at_risk']}\n")
+    for item in managers:
+        marker = '!' if item['at_risk'] else ' '
+        print(f"{marker} {item['manager_name']} (ID: {item['manager_id']}): осталось {item['left']}, "
+              f"расход {item['rate_per_day']:.1f}/сутки, исчерпание {'уже исчерпан' if item['exhausted'] else format_time(item['exhaust_at'])}")
+
+# Потоковая выгрузка лимитов всех менеджеров в NDJSON или CSV.
+# Если файл уже существует, менеджеры, записанные в нем, пропускаются.
+def export_limits(fmt, output=None):
+    from fetcher import iter_limits
+    from export import read_written_ids, write_export
+
+    ensure_access_token()
+    employer_id = get_employer_id(get_current_user_info())
+    managers = get_managers(employer_id)
+
+    filename = output or f"manager_limits_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    written = read_written_ids(filename, fmt)
+    pending = [m for m in managers if str(m.get('id')) not in written]
+    if written:
+        print(f'Продолжение выгрузки {filename}: уже записано {len(written)}, осталось {len(pending)}')
+
+    count = write_export(filename, iter_limits(employer_id, pending, get_resume_view_limits), fmt)
+    print(f'Записано менеджеров: {count}, файл {filename}')
+    print_upstream_latency()
+
+# Сбор лимитов по списку аккаунтов работодателей в пуле процессов
+# со сводной выгрузкой по всем аккаунтам в один файл
+def batch_limits(accounts_file, processes, fmt, output=None, save_snapshots=False):
+    from batch import load_roster, run_batch, default_options, BatchError
+    from export import BATCH_CSV_FIELDS, make_record, format_csv_header, format_csv, format_ndjson
+    from snapshots import SNAPSHOT_DB_PATH
+
+    try:
+        accounts = load_roster(accounts_file)
+    except (OSError, ValueError, BatchError) as e:
+        raise HHApiError(f'Ошибка при чтении списка аккаунтов: {e}')
+    if not accounts:
+        print(f'В {accounts_file} нет ни одного аккаунта.')
+        return
+
+    options = default_options(CLIENT_ID, CLIENT_SECRET, USER_AGENT, SNAPSHOT_DB_PATH if save_snapshots else None)
+    filename = output or f"batch_limits_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    print(f'Аккаунтов: {len(accounts)}, процессов: {min(processes, len(accounts))}, файл {filename}\n')
+
+    summaries = []
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            f.write(format_csv_header(BATCH_CSV_FIELDS))
+        for summary in run_batch(accounts, options, processes):
+            fetched_at = time.time()
+            for item in summary['results']:
+                record = {'account': summary['account'], 'employer_id': summary['employer_id']}
+                record.update(make_record(item, fetched_at))
+                f.write(format_ndjson(record) if fmt == 'ndjson' else format_csv(record, BATCH_CSV_FIELDS))
+            f.flush()
+            summaries.append(summary)
+            if summary['error']:
+                print(f"{summary['account']}: ошибка — {summary['error']}")
+            else:
+                left = sum((item['limits'] or {}).get('left', {}).get('resume_view') or 0 for item in summary['results'])
+                failed = sum(1 for item in summary['results'] if item['error'])
+                print(f"{summary['account']} (EMPLOYER_ID: {summary['employer_id']}): менеджеров {len(summary['results'])}, "
+                      f"без лимитов {failed}, осталось просмотров {left}, "
+                      f"запросов к HH {summary['requests']}, {summary['seconds']:.1f} с")
+
+    failed_accounts = [summary['account'] for summary in summaries if summary['error']]
+    print(f"\nМенеджеров: {sum(len(summary['results']) for summary in summaries)}, "
+          f"аккаунтов с ошибкой: {len(failed_accounts)} из {len(summaries)}, файл {filename}")
+    if failed_accounts:
+        exit(1)
+
+# Точка входа CLI: настройки читаются здесь, до импорта модулей, которые
+# берут значения по умолчанию из окружения
+def main():
+    load_config()
+    from collector import COLLECT_INTERVAL
+    from governor import BATCH
+    from batch import ACCOUNTS_FILE, BATCH_PROCESSES
+
+    # Запросы скрипта уступают интерактивным запросам веб-интерфейса
+    hh_client.set_default_priority(BATCH)
+
+    parser = argparse.ArgumentParser(description='Лимиты просмотра резюме менеджеров HH.ru')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('dump', help='разовая выгрузка лимитов в файл (по умолчанию)')
+    collect_parser = subparsers.add_parser('collect', help='постоянный сбор снимков лимитов в локальную базу')
+    collect_parser.add_argument('--interval', type=int, default=COLLECT_INTERVAL, help='интервал между обходами, секунды')
+    collect_parser.add_argument('--cycles', type=int, default=None, help='количество обходов (по умолчанию бесконечно)')
+    export_parser = subparsers.add_parser('export', help='потоковая выгрузка лимитов в NDJSON или CSV')
+    export_parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson', help='формат выгрузки')
+    export_parser.add_argument('--output', help='файл выгрузки; если он существует, выгрузка продолжается')
+    forecast_parser = subparsers.add_parser('forecast', help='прогноз исчерпания лимитов по истории снимков')
+    forecast_parser.add_argument('--employer-id', help='ID работодателя (по умолчанию из /me)')
+    batch_parser = subparsers.add_parser('batch', help='сбор лимитов по списку аккаунтов работодателей')
+    batch_parser.add_argument('--accounts', default=ACCOUNTS_FILE, help='JSON-файл со списком аккаунтов')
+    batch_parser.add_argument('--processes', type=int, default=BATCH_PROCESSES, help='аккаунтов, обрабатываемых одновременно')
+    batch_parser.add_argument('--format', choices=('ndjson', 'csv'), default='csv', help='формат сводной выгрузки')
+    batch_parser.add_argument('--output', help='файл сводной выгрузки')
+    batch_parser.add_argument('--snapshots', action='store_true', help='сохранить снимки лимитов в локальную базу')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'collect':
+            collect_limits(args.interval, args.cycles)
+        elif args.command == 'export':
+            export_limits(args.format, args.output)
+        elif args.command == 'forecast':
+            print_forecast(args.employer_id)
+        elif args.command == 'batch':
+            batch_limits(args.accounts, args.processes, args.format, args.output, args.snapshots)
+        else:
+            dump_limits()
+    except HHApiError as e:
+        print(str(e))
+        exit()
+
+if __name__ == '__main__':
+    main()
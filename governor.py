@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Windows: только состояние внутри процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Настройки ограничителя частоты запросов к HH.ru
+GOVERNOR_RATE = float(os.getenv('GOVERNOR_RATE', '10'))  # запросов в секунду
+GOVERNOR_BURST = float(os.getenv('GOVERNOR_BURST', '20'))  # размер «корзины» токенов
+GOVERNOR_MIN_RATE = float(os.getenv('GOVERNOR_MIN_RATE', '0.5'))  # нижняя граница скорости после 429
+GOVERNOR_BATCH_RESERVE = float(os.getenv('GOVERNOR_BATCH_RESERVE', '0.3'))  # доля корзины только для интерактивных запросов
+GOVERNOR_MAX_WAIT = float(os.getenv('GOVERNOR_MAX_WAIT', '5'))  # максимальное ожидание интерактивного запроса, секунды
+GOVERNOR_STATE_FILE = os.getenv('GOVERNOR_STATE_FILE', '')  # общий файл состояния для нескольких процессов
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+
+# Хранение состояния корзины в памяти процесса
+class _MemoryState:
+    def __init__(self, initial):
+        self._state = dict(initial)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            yield self._state
+
+
+# Хранение состояния корзины в файле под блокировкой fcntl (общее для процессов)
+class _FileState:
+    def __init__(self, path, initial):
+        self.path = path
+        self.initial = dict(initial)
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            with open(self.path, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    try:
+                        state = json.loads(f.read() or 'null') or dict(self.initial)
+                    except ValueError:
+                        state = dict(self.initial)
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# Ограничение частоты запросов к HH.ru превышено, а ждать дольше нельзя.
+# Наследуется от RequestException, чтобы обрабатываться как сетевая ошибка.
+class RateLimitExceeded(requests.RequestException):
+    pass
+
+
+# Ограничитель частоты запросов («token bucket») с адаптацией скорости:
+# - каждый запрос забирает токен, токены пополняются со скоростью rate;
+# - ответ 429 вдвое снижает скорость и блокирует запросы на время Retry-After;
+# - успешные ответы постепенно возвращают скорость к максимальной;
+# - пакетные запросы (сборщик) не используют резерв корзины, оставленный
+#   для интерактивных запросов (страницы веб-интерфейса).
+class Governor:
+    def __init__(self, rate=GOVERNOR_RATE, burst=GOVERNOR_BURST, min_rate=GOVERNOR_MIN_RATE,
+                 batch_reserve=GOVERNOR_BATCH_RESERVE, state_file=GOVERNOR_STATE_FILE):
+        self.max_rate = rate
+        self.burst = burst
+        self.min_rate = min(min_rate, rate)
+        self.reserve = burst * batch_reserve
+        initial = {'tokens': burst, 'updated_at': time.time(), 'rate': rate, 'blocked_until': 0.0}
+        if state_file and fcntl is not None:
+            self._state = _FileState(state_file, initial)
+        else:
+            self._state = _MemoryState(initial)
+        self.throttled = 0
+        self.waited = 0.0
+        self._interactive_waiting = 0
+        self._waiting_lock = threading.Lock()
+
+    def _refill(self, state, now):
+        elapsed = max(0.0, now - state['updated_at'])
+        state['tokens'] = min(self.burst, state['tokens'] + elapsed * state['rate'])
+        state['updated_at'] = now
+
+    # Попытка забрать токен. Возвращает 0, если токен получен, иначе время ожидания.
+    def _try_acquire(self, priority):
+        now = time.time()
+        with self._state.transaction() as state:
+            self._refill(state, now)
+            if state['blocked_until'] > now:
+                return state['blocked_until'] - now
+            floor = 1.0
+            if priority == BATCH:
+                floor += self.reserve
+                if self._interactive_waiting:
+                    return 1.0 / state['rate']
+            if state['tokens'] >= floor:
+                state['tokens'] -= 1.0
+                return 0.0
+            return (floor - state['tokens']) / state['rate']
+
+    # Ожидание разрешения на запрос. Интерактивные запросы ждут не дольше max_wait.
+    def acquire(self, priority=INTERACTIVE, max_wait=None):
+        if max_wait is None and priority == INTERACTIVE:
+            max_wait = GOVERNOR_MAX_WAIT
+        started = time.time()
+        if priority == INTERACTIVE:
+            with self._waiting_lock:
+                self._interactive_waiting += 1
+        try:
+            while True:
+                delay = self._try_acquire(priority)
+                if delay <= 0:
+                    self.waited += time.time() - started
+                    return
+                if max_wait is not None and time.time() - started + delay > max_wait:
+                    raise RateLimitExceeded(f"Превышен лимит запросов к HH.ru, повторите через {delay:.0f} с")
+                time.sleep(min(delay, 1.0))
+        finally:
+            if priority == INTERACTIVE:
+                with self._waiting_lock:
+                    self._interactive_waiting -= 1
+
+    # Учет ответа HH.ru: 429 снижает скорость, успешный ответ постепенно ее восстанавливает
+    def observe(self, status_code, retry_after=None):
+        now = time.time()
+        with self._state.transaction() as state:
+            self._refill(state, now)
+            if status_code == 429:
+                self.throttled += 1
+                state['rate'] = max(self.min_rate, state['rate'] / 2)
+                state['tokens'] = 0.0
+                state['blocked_until'] = max(state['blocked_until'], now + (retry_after or 1.0 / state['rate']))
+                logger.warning("HH.ru ограничил частоту запросов (429), скорость снижена до %.2f запросов/с", state['rate'])
+            elif status_code < 500:
+                state['rate'] = min(self.max_rate, state['rate'] + self.max_rate / 100)
+
+    # Момент (UNIX time), до которого запросы заблокированы после 429, или 0
+    def blocked_until(self):
+        with self._state.transaction() as state:
+            return state['blocked_until'] if state['blocked_until'] > time.time() else 0.0
+
+    def stats(self):
+        with self._state.transaction() as state:
+            return {
+                'rate': state['rate'],
+                'tokens': state['tokens'],
+                'throttled': self.throttled,
+                'waited_seconds': self.waited
+            }
+
+
+# Разбор заголовка Retry-After (секунды); None, если заголовка нет или он некорректен
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
@@ -1,16 +1,36 @@
 # Gunicorn configuration file
 import multiprocessing
 import os
+import tempfile
+from dotenv import load_dotenv
+
+# Настройки gunicorn и логирования (logging_setup) читаются из окружения при
+# импорте, поэтому .env загружается до них
+load_dotenv()
+
+# Метрики воркеров объединяются через файлы в общем каталоге (metrics.py);
+# каталог задается до импорта metrics и наследуется воркерами. Путь постоянный
+# (свой для каждого порта), файлы прошлого запуска удаляются в on_starting
+os.environ.setdefault('METRICS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), f"hh_limits_metrics_{os.getenv('PORT', '6859')}"))
+
+import logging_setup
+import metrics
 
 # Server socket
 bind = f"0.0.0.0:{os.getenv('PORT', '6859')}"
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = 'sync'
-worker_connections = 1000
-timeout = 30
+# GUNICORN_WORKER_CLASS: sync (по умолчанию) или gevent.
+# В режиме gevent сетевые вызовы requests не блокируют воркер, поэтому один
+# процесс держит сотни одновременных ожиданий ответа HH.ru (до worker_connections).
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+if worker_class == 'gevent':
+    workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+else:
+    workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
 keepalive = 2
 
 # Logging
@@ -19,6 +39,31 @@ errorlog = '-'   # stdout
 loglevel = 'info'
 access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s"'
 
+
+# Логи приложения: воркеры передают записи через общую очередь,
+# в файл (LOG_FILE, с ротацией) и stdout пишет только мастер-процесс
+def on_starting(server):
+    logging_setup.start_shared_writer()
+    metrics.reset_multiprocess_dir()
+
+
+def post_fork(server, worker):
+    logging_setup.attach_worker()
+
+
+# Метрики воркера: последняя запись перед завершением, затем мастер переносит
+# его счетчики в архив каталога метрик
+def worker_exit(server, worker):
+    metrics.write_process_file()
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    metrics.reset_multiprocess_dir(remove=True)
+
 # Process naming
 proc_name = 'hh_limits'
 
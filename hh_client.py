@@ -0,0 +1,237 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from governor import Governor, INTERACTIVE, BATCH, parse_retry_after
+import breaker
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Базовые адреса API и OAuth HH.ru
+API_URL = os.getenv('HH_API_URL', 'https://api.hh.ru').rstrip('/')
+OAUTH_URL = os.getenv('HH_OAUTH_URL', 'https://hh.ru').rstrip('/')
+
+# Настройки пула соединений и повторных попыток
+REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', '10'))  # ожидание ответа, секунды
+REQUEST_CONNECT_TIMEOUT = float(os.getenv('REQUEST_CONNECT_TIMEOUT', '3'))  # установка соединения, секунды
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '4'))  # количество хостов в пуле
+# В режиме gevent одновременных запросов в процессе намного больше, поэтому пул шире
+_ASYNC_WORKERS = os.getenv('GUNICORN_WORKER_CLASS', 'sync') == 'gevent'
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '100' if _ASYNC_WORKERS else '16'))  # соединений на хост
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '2'))
+HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.3'))
+# Общий срок всех запросов к HH.ru при обработке одного запроса веб-приложения, секунды.
+# Для sync-воркеров — половина таймаута gunicorn: запрос к недоступному HH.ru завершается
+# ошибкой (и учитывается выключателем) раньше, чем мастер перезапустит воркер. 0 — без срока.
+REQUEST_BUDGET = float(os.getenv('REQUEST_BUDGET', '0' if _ASYNC_WORKERS else str(int(os.getenv('GUNICORN_TIMEOUT', '30')) / 2)))
+# Сколько раз пакетный запрос повторяется после ответа 429
+GOVERNOR_429_RETRIES = int(os.getenv('GOVERNOR_429_RETRIES', '3'))
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+# Общий для всех запросов процесса ограничитель частоты
+governor = Governor()
+_default_priority = INTERACTIVE
+# Срок запросов текущего запроса веб-приложения (time.monotonic()); копируется в пулы потоков через bind_context
+_deadline = contextvars.ContextVar('hh_request_deadline', default=None)
+
+
+# Срок запросов к HH.ru истек: запрос не отправляется
+class DeadlineExceeded(requests.Timeout):
+    pass
+
+
+# Начало срока запросов к HH.ru (веб-приложение, before_request). Возвращает токен для end_deadline.
+def start_deadline(budget=REQUEST_BUDGET):
+    return _deadline.set(time.monotonic() + budget if budget > 0 else None)
+
+
+def end_deadline(token):
+    _deadline.reset(token)
+
+
+# Приоритет запросов процесса по умолчанию: interactive (веб-интерфейс) или batch (сборщик)
+def set_default_priority(priority):
+    global _default_priority
+    _default_priority = priority
+
+
+# Замена ограничителя частоты процесса (пакетный сбор: свой лимит у каждого аккаунта)
+def set_governor(new_governor):
+    global governor
+    governor = new_governor
+
+
+# Создание сессии с пулом keep-alive соединений и политикой повторов.
+# Повторяются только идемпотентные GET-запросы при ошибках соединения и 502/503/504.
+# Таймаут ожидания ответа не повторяется (read=False): иначе один запрос занимал бы
+# до (1 + HTTP_MAX_RETRIES) * REQUEST_TIMEOUT секунд, дольше таймаута воркера gunicorn,
+# а ошибка приходила бы как ConnectionError вместо requests.Timeout.
+def _create_session():
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        connect=HTTP_MAX_RETRIES,
+        read=False,
+        status=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+# Общая сессия процесса. После fork (воркеры gunicorn) создается заново,
+# чтобы процессы не делили сокеты родителя.
+def get_session():
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = _create_session()
+                _session_pid = pid
+    return _session
+
+
+# Пробный запрос выключателя: повтор неудачного GET-запроса с коротким таймаутом,
+# без повторов urllib3 и без заголовка Authorization. Проверяется только, что HH.ru
+# отвечает (401/403 без токена тоже замыкает цепь), а токен пользователя
+# не хранится в фоновом потоке, пока цепь разомкнута.
+def _probe_func(url, kwargs):
+    headers = {name: value for name, value in (kwargs.get('headers') or {}).items() if name.lower() != 'authorization'}
+    params = kwargs.get('params')
+
+    def probe():
+        governor.acquire(BATCH)
+        return requests.get(url, headers=headers, params=params, timeout=breaker.BREAKER_PROBE_TIMEOUT)
+    return probe
+
+
+# Выключатель адреса для GET-запросов (breaker.py). POST-запросы (OAuth) не повторяются
+# в фоне, поэтому проходят без выключателя.
+def _circuit(method, url):
+    if method != 'GET' or not breaker.BREAKER_ENABLED:
+        return None
+    return breaker.get_breaker(metrics.endpoint_template(url))
+
+
+# Разомкнута ли цепь для адреса HH.ru: запросы к нему сейчас не отправляются
+def circuit_open(url):
+    return breaker.is_open(metrics.endpoint_template(url))
+
+
+# Запрос через ограничитель частоты с замером длительности (metrics.py). Пакетные запросы после ответа 429
+# ждут окончания блокировки и повторяются; интерактивные возвращают 429 сразу.
+# Если адрес не отвечает, выключатель сразу завершает запрос ошибкой CircuitOpenError.
+def request(method, url, priority=None, **kwargs):
+    priority = priority or _default_priority
+    # Отдельный короткий таймаут соединения: повторы соединения (HTTP_MAX_RETRIES)
+    # вместе с ожиданием ответа укладываются в таймаут воркера gunicorn
+    timeout = kwargs.get('timeout', REQUEST_TIMEOUT)
+    if isinstance(timeout, (int, float)):
+        timeout = (min(REQUEST_CONNECT_TIMEOUT, timeout), timeout)
+    deadline = _deadline.get()
+    circuit = _circuit(method, url)
+    attempts = GOVERNOR_429_RETRIES + 1 if priority == BATCH else 1
+    for attempt in range(attempts):
+        if circuit is not None:
+            circuit.before_request()
+        waiting_since = time.perf_counter()
+        governor.acquire(priority)
+        started = time.perf_counter()
+        metrics.GOVERNOR_WAIT.observe(started - waiting_since, priority=priority)
+        kwargs['timeout'] = timeout
+        # Таймауты сокращаются до остатка срока запроса веб-приложения
+        if deadline is not None and isinstance(timeout, tuple):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f'Истек срок запросов к HH.ru ({REQUEST_BUDGET:g} с)')
+            kwargs['timeout'] = tuple(min(part, remaining) for part in timeout)
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.observe_upstream(method, url, 'error', time.perf_counter() - started)
+            if circuit is not None:
+                circuit.record_failure(_probe_func(url, kwargs))
+            raise
+        elapsed = time.perf_counter() - started
+        metrics.observe_upstream(method, url, response.status_code, elapsed)
+        logger.debug("%s %s -> %s за %.0f мс", method, url, response.status_code, elapsed * 1000)
+        governor.observe(response.status_code, parse_retry_after(response.headers.get('Retry-After')))
+        if circuit is not None:
+            if response.status_code >= 500:
+                circuit.record_failure(_probe_func(url, kwargs))
+            else:
+                circuit.record_success()
+        if response.status_code != 429:
+            break
+    return response
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+# Момент (UNIX time), до которого HH.ru ограничил частоту запросов, или 0
+def throttled_until():
+    return governor.blocked_until()
+
+
+# Статистика соединений: сколько запросов выполнено и сколько из них
+# потребовали нового TCP/TLS-соединения, а сколько переиспользовали keep-alive
+def get_connection_stats():
+    total_requests = 0
+    new_connections = 0
+    if _session is not None and _session_pid == os.getpid():
+        for adapter in set(_session.adapters.values()):
+            poolmanager = getattr(adapter, 'poolmanager', None)
+            if poolmanager is None:
+                continue
+            for key in list(poolmanager.pools.keys()):
+                pool = poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                total_requests += pool.num_requests
+                new_connections += pool.num_connections
+    return {
+        'requests': total_requests,
+        'new_connections': new_connections,
+        'reused_connections': max(0, total_requests - new_connections)
+    }
+
+
+# Метрики ограничителя частоты и пула соединений для /metrics
+def _collect_metrics():
+    governor_stats = governor.stats()
+    connection_stats = get_connection_stats()
+    return [
+        ('hh_governor_rate', 'gauge', 'Текущая разрешенная скорость запросов к HH.ru, запросов/с', [({}, governor_stats['rate'])]),
+        ('hh_governor_tokens', 'gauge', 'Свободные токены ограничителя частоты', [({}, governor_stats['tokens'])]),
+        ('hh_governor_throttled_total', 'counter', 'Ответы 429 от HH.ru', [({}, governor_stats['throttled'])]),
+        ('hh_http_pool_requests_total', 'counter', 'Запросы через пул соединений', [({}, connection_stats['requests'])]),
+        ('hh_http_pool_new_connections_total', 'counter', 'Новые TCP/TLS-соединения пула', [({}, connection_stats['new_connections'])]),
+        ('hh_http_pool_maxsize', 'gauge', 'Размер пула соединений на хост', [({}, HTTP_POOL_MAXSIZE)])
+    ]
+
+
+metrics.register_collector(_collect_metrics)
@@ -0,0 +1,161 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import contextvars
+import multiprocessing
+from functools import partial
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Настройки логирования
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text или json (одна запись JSON в строке)
+LOG_FILE = os.getenv('LOG_FILE', 'app.log')  # пусто — только stdout
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))  # размер файла до ротации
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))  # сколько старых файлов хранить
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))  # при переполнении записи отбрасываются
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+# Идентификатор запроса веб-интерфейса, к которому относятся записи лога
+request_id_var = contextvars.ContextVar('request_id', default='-')
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_listener = None
+_listener_pid = None
+_shared_queue = None
+_configured = False
+
+
+# Идентификатор запроса: из заголовка X-Request-ID (если он корректен) или новый
+def bind_request_id(value=None):
+    request_id = value if value and _REQUEST_ID.match(value) else uuid.uuid4().hex[:16]
+    return request_id_var.set(request_id), request_id
+
+
+# Сброс идентификатора после запроса. Потоковый ответ может завершиться
+# в другом контексте, тогда сбрасывать нечего.
+def reset_request_id(token):
+    try:
+        request_id_var.reset(token)
+    except ValueError:
+        pass
+
+
+# Функция для пула потоков, выполняемая в контексте вызывающего потока,
+# чтобы записи лога из пула сохраняли идентификатор запроса
+def bind_context(func, *args, **kwargs):
+    return partial(contextvars.copy_context().run, func, *args, **kwargs)
+
+
+# Добавляет в запись идентификатор запроса. Выполняется в потоке, который пишет в лог,
+# до передачи записи в очередь.
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+# Запись лога в виде одной строки JSON
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+            'pid': record.process
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# Постановка записи в очередь без ожидания: если писатель не успевает,
+# запись отбрасывается, а не задерживает обработку запроса
+class _NonBlockingQueueHandler(QueueHandler):
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _make_formatter():
+    if LOG_FORMAT == 'json':
+        return JsonFormatter()
+    return logging.Formatter(TEXT_FORMAT)
+
+
+# Обработчики писателя: stdout и файл с ротацией
+def _writer_handlers(log_file):
+    formatter = _make_formatter()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+# Запуск потока-писателя, который забирает записи из очереди и пишет их на диск
+def _start_listener(log_queue, log_file):
+    global _listener, _listener_pid
+    _listener = QueueListener(log_queue, *_writer_handlers(log_file), respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    atexit.register(_stop_listener)
+
+
+# Остановка писателя при выходе. В дочерних процессах (воркерах) писатель
+# принадлежит родителю, поэтому не останавливается.
+def _stop_listener():
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+
+
+# Корневой логгер процесса пишет только в очередь
+def _install_queue_handler(log_queue):
+    global _configured
+    handler = _NonBlockingQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    _configured = True
+
+
+# Логирование отдельного процесса (python app.py, get.py collect):
+# очередь и поток-писатель внутри процесса.
+# Под gunicorn воркер уже подключен к общей очереди мастера и повторно не настраивается.
+def setup_logging(log_file=LOG_FILE):
+    if _configured:
+        return
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    _start_listener(log_queue, log_file)
+    _install_queue_handler(log_queue)
+
+
+# Gunicorn, мастер-процесс (хук on_starting): общая очередь и единственный
+# писатель на сервер, поэтому записи воркеров не перемешиваются внутри строк,
+# а ротацию файла выполняет один процесс
+def start_shared_writer(log_file=LOG_FILE):
+    global _shared_queue
+    _shared_queue = multiprocessing.Queue(LOG_QUEUE_SIZE)
+    _start_listener(_shared_queue, log_file)
+
+
+# Gunicorn, воркер (хук post_fork): записи отправляются в очередь мастера
+def attach_worker():
+    if _shared_queue is not None:
+        _install_queue_handler(_shared_queue)
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import hh_client
+from hh_client import API_URL
+from fetcher import FETCH_MAX_WORKERS
+from logging_setup import bind_context
+
+logger = logging.getLogger(__name__)
+
+# Размер страницы списка менеджеров и каталог локального справочника
+MANAGERS_PER_PAGE = int(os.getenv('MANAGERS_PER_PAGE', '100'))
+MANAGERS_CACHE_DIR = os.getenv('MANAGERS_CACHE_DIR', 'data/managers')
+
+
+# Ошибка получения списка менеджеров
+class ManagerSyncError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Отпечаток записи менеджера: меняется при любом изменении данных в списке
+def _fingerprint(item):
+    return hashlib.sha256(json.dumps(item, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+# Справочник менеджеров работодателя с локальным кешем.
+# Страницы /employers/{id}/managers запрашиваются параллельно и условно
+# (If-None-Match / If-Modified-Since), неизмененные страницы берутся из кеша;
+# файл справочника перезаписывается, только если список изменился.
+class ManagerDirectory:
+    def __init__(self, employer_id, cache_dir=MANAGERS_CACHE_DIR, per_page=MANAGERS_PER_PAGE):
+        self.employer_id = str(employer_id)
+        self.per_page = per_page
+        self.path = os.path.join(cache_dir, f'{self.employer_id}.json') if cache_dir else None
+        self.state = self._load()
+        self.changed = []
+        self.removed = []
+
+    def _load(self):
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("Не удалось прочитать справочник менеджеров %s: %s", self.path, e)
+        return {'pages': {}, 'managers': {}, 'synced_at': None}
+
+    # Атомарная запись кеша: временный файл и переименование
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Не удалось сохранить справочник менеджеров: %s", e)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    # Менеджеры из локального справочника без запросов к HH.ru (последняя синхронизация)
+    def known_items(self):
+        return [manager['item'] for manager in self.state['managers'].values()]
+
+    # Условный запрос одной страницы. Возвращает (страница, получена ли заново)
+    def _fetch_page(self, page, headers):
+        cached = self.state['pages'].get(str(page))
+        request_headers = dict(headers)
+        if cached:
+            if cached.get('etag'):
+                request_headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                request_headers['If-Modified-Since'] = cached['last_modified']
+
+        url = f'{API_URL}/employers/{self.employer_id}/managers'
+        response = hh_client.get(url, headers=request_headers, params={'page': page, 'per_page': self.per_page})
+        if response.status_code == 304 and cached:
+            return cached, False
+        if response.status_code != 200:
+            raise ManagerSyncError(f"Ошибка при получении списка менеджеров (страница {page}): {response.status_code}\n{response.text}",
+                                   response.status_code)
+
+        data = response.json()
+        return {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'pages': data.get('pages', 1),
+            'items': data.get('items', [])
+        }, True
+
+    # Синхронизация справочника. Возвращает список менеджеров в порядке HH.ru;
+    # новые и измененные менеджеры — в self.changed, удаленные — в self.removed.
+    def sync(self, headers):
+        first, _ = self._fetch_page(0, headers)
+        pages = {0: first}
+        total_pages = max(1, int(first.get('pages') or 1))
+
+        if total_pages > 1:
+            workers = max(1, min(FETCH_MAX_WORKERS, total_pages - 1))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hh-managers') as executor:
+                for page, (data, _) in zip(
+                    range(1, total_pages),
+                    executor.map(lambda task: task(), [bind_context(self._fetch_page, p, headers) for p in range(1, total_pages)])
+                ):
+                    pages[page] = data
+
+        items = [item for page in range(total_pages) for item in pages[page]['items'] if item.get('id')]
+        previous = self.state['managers']
+        managers = {}
+        changed = []
+        for item in items:
+            manager_id = str(item['id'])
+            fingerprint = _fingerprint(item)
+            known = previous.get(manager_id)
+            if known and known['fingerprint'] == fingerprint:
+                managers[manager_id] = known
+            else:
+                managers[manager_id] = {'item': item, 'fingerprint': fingerprint}
+                changed.append(manager_id)
+
+        removed = set(previous) - set(managers)
+        if changed or removed:
+            logger.info("Справочник менеджеров %s: всего %s, новых или измененных %s, удаленных %s", self.employer_id, len(managers), len(changed), len(removed))
+
+        # Все страницы 304 (или те же данные) и менеджеры не изменились: файл не перезаписывается
+        pages = {str(page): data for page, data in pages.items()}
+        dirty = bool(changed or removed) or pages != self.state['pages']
+        self.state = {
+            'pages': pages,
+            'managers': managers,
+            'synced_at': time.time()
+        }
+        if dirty:
+            self._save()
+        self.changed = changed
+        self.removed = sorted(removed)
+        return items
@@ -0,0 +1,373 @@
+import os
+import re
+import json
+import stat
+import time
+import bisect
+import logging
+import tempfile
+import threading
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Настройки метрик
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # если задан, /metrics требует заголовок Authorization: Bearer <токен>
+METRICS_PUBLIC = os.getenv('METRICS_PUBLIC', '0') == '1'  # 1 — /metrics без токена доступна не только с этого сервера
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR', '')  # общий каталог метрик воркеров gunicorn
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))  # период записи метрик воркера в каталог, секунды
+METRICS_TEXTFILE = os.getenv('METRICS_TEXTFILE', '')  # файл метрик сборщика для textfile collector node_exporter
+
+# Границы корзин гистограмм длительности, секунды
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_metrics = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Базовый класс метрики с метками. Значения хранятся по кортежу значений меток.
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    # Ряды метрики: [(имя ряда, метки, значение), ...]
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in values]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+# Гистограмма: для каждого набора меток хранит счетчики по корзинам, сумму и количество
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    # Сводка по каждому набору меток: (метки, количество, среднее значение)
+    def summary(self):
+        with self._lock:
+            values = sorted((key, series[1], series[2]) for key, series in self._values.items())
+        return [(dict(zip(self.labelnames, key)), count, total / count if count else 0.0) for key, total, count in values]
+
+    # Накопленные счетчики корзин, сумма и количество — все ряды суммируются между воркерами
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(series[0]), series[1], series[2]) for key, series in self._values.items())
+        samples = []
+        for key, counts, total, count in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', dict(labels, le=_format_value(float(bound))), cumulative))
+            samples.append((f'{self.name}_sum', labels, total))
+            samples.append((f'{self.name}_count', labels, count))
+        return samples
+
+
+# Регистрация функции, которая при каждом запросе /metrics возвращает
+# список (имя, тип, описание, [(метки, значение), ...]) — для счетчиков,
+# которые уже ведутся в других модулях (кеши, ограничитель, пул соединений).
+def register_collector(func):
+    with _registry_lock:
+        _collectors.append(func)
+
+
+# Метрики процесса: [(имя, тип, описание, [(имя ряда, метки, значение), ...]), ...]
+def collect():
+    families = []
+    with _registry_lock:
+        metrics = list(_metrics)
+        collectors = list(_collectors)
+    for metric in metrics:
+        families.append((metric.name, metric.kind, metric.documentation, metric.samples()))
+    for collector in collectors:
+        try:
+            collected = collector()
+        except Exception as e:
+            logger.warning("Ошибка при сборе метрик: %s", e)
+            continue
+        for name, kind, documentation, samples in collected:
+            families.append((name, kind, documentation, [(name, labels, value) for labels, value in samples]))
+    return families
+
+
+def _render_families(families):
+    lines = []
+    for name, kind, documentation, samples in families:
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {kind}')
+        for sample_name, labels, value in samples:
+            lines.append(f'{sample_name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# Метрики в текстовом формате Prometheus: в воркере gunicorn — по всем воркерам
+# (start_multiprocess), иначе — только текущего процесса
+def render():
+    if _multiprocess_dir:
+        return _render_families(_collect_multiprocess(_multiprocess_dir))
+    return _render_families(collect())
+
+
+# Атомарная запись файла: читатель видит либо прежнее, либо новое содержимое
+def _write_atomic(path, text):
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# Запись метрик в файл (атомарно) для textfile collector node_exporter
+def write_textfile(path=METRICS_TEXTFILE):
+    if not path:
+        return
+    try:
+        _write_atomic(path, render())
+    except OSError as e:
+        logger.warning("Не удалось записать файл метрик %s: %s", path, e)
+
+
+# Метрики нескольких воркеров gunicorn. Реестр у каждого воркера свой, поэтому
+# воркер раз в METRICS_FLUSH_INTERVAL секунд (и перед ответом /metrics) записывает
+# свои метрики в METRICS_MULTIPROC_DIR/worker_<pid>.json, а ответ /metrics
+# объединяет файлы всех воркеров: счетчики и гистограммы суммируются, у gauge
+# добавляется метка worker. Метрики другого воркера отстают не больше чем на
+# METRICS_FLUSH_INTERVAL секунд.
+_WORKER_PREFIX = 'worker_'
+_ARCHIVE_FILE = 'archive.json'
+_multiprocess_dir = None
+
+
+def _worker_file(directory, pid):
+    return os.path.join(directory, f'{_WORKER_PREFIX}{pid}.json')
+
+
+def _read_families(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Не удалось прочитать файл метрик %s: %s", path, e)
+        return None
+
+
+# Объединение метрик: [(pid воркера или None для архива, семейства)]. Ряды gauge
+# без pid (архив завершившихся воркеров) не выводятся.
+def _merge(entries):
+    merged = {}
+    for pid, families in entries:
+        for name, kind, documentation, samples in families:
+            values = merged.setdefault(name, (kind, documentation, {}))[2]
+            for sample_name, labels, value in samples:
+                if kind == 'gauge':
+                    if pid is None:
+                        continue
+                    labels = dict(labels, worker=str(pid))
+                key = (sample_name, tuple(labels.items()))
+                values[key] = values.get(key, 0) + value
+    return [
+        (name, kind, documentation, [(sample_name, dict(labels), value) for (sample_name, labels), value in values.items()])
+        for name, (kind, documentation, values) in merged.items()
+    ]
+
+
+def _collect_multiprocess(directory):
+    write_process_file()
+    entries = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        families = _read_families(os.path.join(directory, filename))
+        if families is None:
+            continue
+        pid = filename[len(_WORKER_PREFIX):-len('.json')] if filename.startswith(_WORKER_PREFIX) else None
+        entries.append((pid, families))
+    return _merge(entries)
+
+
+# Запись метрик текущего воркера в общий каталог
+def write_process_file():
+    if not _multiprocess_dir:
+        return
+    try:
+        _write_atomic(_worker_file(_multiprocess_dir, os.getpid()), json.dumps(collect(), ensure_ascii=False))
+    except OSError as e:
+        logger.warning("Не удалось записать метрики воркера в %s: %s", _multiprocess_dir, e)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        write_process_file()
+
+
+# Gunicorn, воркер (create_app): включение общего каталога метрик
+def start_multiprocess(directory=METRICS_MULTIPROC_DIR):
+    global _multiprocess_dir
+    if not directory or not METRICS_ENABLED or _multiprocess_dir:
+        return
+    _multiprocess_dir = directory
+    write_process_file()
+    threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+
+
+# Gunicorn, мастер: в хуке on_starting удаляются файлы метрик прошлого запуска,
+# в хуке on_exit (remove=True) — и сам каталог. Каталог в общем /tmp используется,
+# только если принадлежит текущему пользователю.
+def reset_multiprocess_dir(directory=METRICS_MULTIPROC_DIR, remove=False):
+    if not directory:
+        return
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise RuntimeError(f'{directory}: каталог метрик принадлежит другому пользователю, задайте METRICS_MULTIPROC_DIR')
+    for filename in os.listdir(directory):
+        if filename.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directory, filename))
+    if remove:
+        os.rmdir(directory)
+
+
+# Gunicorn, мастер (хук child_exit): счетчики и гистограммы завершившегося
+# воркера переносятся в архив, чтобы суммы не уменьшались после перезапуска
+# воркера; его gauge больше не выводятся
+def mark_process_dead(pid, directory=METRICS_MULTIPROC_DIR):
+    if not directory:
+        return
+    path = _worker_file(directory, pid)
+    families = _read_families(path)
+    if families is None:
+        return
+    archive_path = os.path.join(directory, _ARCHIVE_FILE)
+    archive = _read_families(archive_path) or []
+    try:
+        _write_atomic(archive_path, json.dumps(_merge([(None, archive), (None, families)]), ensure_ascii=False))
+        os.remove(path)
+    except OSError as e:
+        logger.warning("Не удалось перенести метрики воркера %s в архив: %s", pid, e)
+
+
+# Шаблон адреса HH.ru без идентификаторов, чтобы число рядов метрики не росло:
+# /employers/123/managers/456/limits/resume -> /employers/{id}/managers/{id}/limits/resume
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def endpoint_template(url):
+    return _ID_SEGMENT.sub('/{id}', urlsplit(url).path) or '/'
+
+
+# Метрики запросов к HH.ru (заполняются в hh_client.request)
+UPSTREAM_LATENCY = Histogram(
+    'hh_upstream_request_duration_seconds',
+    'Длительность запросов к HH.ru по адресу и статусу ответа',
+    ('method', 'endpoint', 'status')
+)
+GOVERNOR_WAIT = Histogram(
+    'hh_governor_wait_seconds',
+    'Ожидание разрешения ограничителя частоты перед запросом к HH.ru',
+    ('priority',)
+)
+TOKEN_REFRESHES = Counter(
+    'hh_token_refreshes_total',
+    'Обновления access token: refreshed — запрос к HH.ru, reused — результат другого потока или воркера',
+    ('result',)
+)
+# Загрузка пула параллельных запросов лимитов (fetcher.py)
+FETCH_IN_PROGRESS = Gauge('hh_fetch_in_progress', 'Выполняемые сейчас запросы лимитов менеджеров')
+# Метрики веб-приложения (заполняются в app.py)
+HTTP_LATENCY = Histogram(
+    'hh_http_request_duration_seconds',
+    'Длительность обработки запросов веб-приложения',
+    ('method', 'endpoint', 'status')
+)
+HTTP_IN_PROGRESS = Gauge('hh_http_requests_in_progress', 'Запросы, которые обрабатывает воркер')
+RENDER_LATENCY = Histogram(
+    'hh_template_render_seconds',
+    'Время отрисовки шаблонов',
+    ('template',),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+
+
+# Замер длительности запроса к HH.ru. status — код ответа или 'error' при сетевой ошибке
+def observe_upstream(method, url, status, duration):
+    if METRICS_ENABLED:
+        UPSTREAM_LATENCY.observe(duration, method=method, endpoint=endpoint_template(url), status=status)
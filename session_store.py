@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import secrets
+import sqlite3
+import logging
+import threading
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import Signer, BadSignature
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+# Настройки серверного хранилища сессий
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'sqlite')  # sqlite, redis или cookie
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', 'flask_session/sessions.db')
+SESSION_REDIS_URL = os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/1')
+SESSION_CLEANUP_INTERVAL = float(os.getenv('SESSION_CLEANUP_INTERVAL', '600'))  # период удаления истекших сессий, секунды
+
+
+# Интерфейс хранилища сессий: данные сессии хранятся на сервере,
+# в cookie передается только непрозрачный идентификатор
+class SessionStore:
+    def load(self, sid):
+        raise NotImplementedError
+
+    def save(self, sid, data, expires_at):
+        raise NotImplementedError
+
+    def delete(self, sid):
+        raise NotImplementedError
+
+    # Удаление истекших сессий (хранилища со сроком жизни записей его не требуют)
+    def cleanup(self):
+        pass
+
+
+# Хранилище сессий в файле SQLite (по умолчанию)
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path=SESSION_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        # В сессиях токены HH.ru всех пользователей: файл базы создается с правами
+        # только для владельца до подключения, SQLite создает файлы -wal и -shm
+        # с правами файла базы
+        os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+        os.chmod(path, 0o600)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS sessions ('
+                'sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)')
+        # Файлы, созданные прежними версиями с правами по умолчанию
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.chmod(path + suffix, 0o600)
+
+    # Отдельное соединение на поток (и на процесс после fork)
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self, sid):
+        row = self._connect().execute(
+            'SELECT data FROM sessions WHERE sid = ? AND expires_at > ?', (sid, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, sid, data, expires_at):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+            (sid, json.dumps(data, ensure_ascii=False), expires_at)
+        )
+
+    def delete(self, sid):
+        self._connect().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+    def cleanup(self):
+        self._connect().execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),))
+
+
+# Хранилище сессий в Redis (требует пакет redis)
+class RedisSessionStore(SessionStore):
+    prefix = 'hh_limits:session:'
+
+    def __init__(self, url=SESSION_REDIS_URL):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def load(self, sid):
+        raw = self._client.get(self.prefix + sid)
+        return json.loads(raw) if raw is not None else None
+
+    def save(self, sid, data, expires_at):
+        ttl = max(1, int(expires_at - time.time()))
+        self._client.set(self.prefix + sid, json.dumps(data, ensure_ascii=False), ex=ttl)
+
+    def delete(self, sid):
+        self._client.delete(self.prefix + sid)
+
+
+def create_session_store(name=None):
+    name = name or SESSION_BACKEND
+    if name == 'redis':
+        return RedisSessionStore()
+    if name == 'sqlite':
+        return SQLiteSessionStore()
+    return None
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.previous_sid = None
+
+    # Новый идентификатор с прежними данными; прежний удаляется из хранилища при сохранении
+    def regenerate(self):
+        if not self.new and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+# Смена идентификатора сессии при входе и выходе (защита от фиксации сессии).
+# Для сессии в cookie Flask (SESSION_BACKEND=cookie) идентификатора нет.
+def regenerate_session(session):
+    if isinstance(session, ServerSideSession):
+        session.regenerate()
+
+
+# Интерфейс сессий Flask поверх серверного хранилища.
+# Cookie содержит только подписанный идентификатор сессии.
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, store, cleanup_interval=SESSION_CLEANUP_INTERVAL):
+        self.store = store
+        self.cleanup_interval = cleanup_interval
+        self._cleanup_at = 0.0
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='hh-limits-session')
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                try:
+                    data = self.store.load(sid)
+                except Exception as e:
+                    logger.error("Ошибка чтения сессии из хранилища: %s", e)
+                    data = None
+                if data is not None:
+                    return ServerSideSession(data, sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        self._cleanup()
+        if session.previous_sid:
+            self.store.delete(session.previous_sid)
+            session.previous_sid = None
+
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified:
+            expires_at = time.time() + app.permanent_session_lifetime.total_seconds()
+            self.store.save(session.sid, dict(session), expires_at)
+
+        if session.new or session.modified:
+            response.set_cookie(
+                name,
+                self._signer(app).sign(session.sid).decode(),
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app)
+            )
+
+    # Удаление истекших сессий не чаще раза в cleanup_interval секунд на процесс
+    def _cleanup(self):
+        now = time.time()
+        if now < self._cleanup_at:
+            return
+        self._cleanup_at = now + self.cleanup_interval
+        try:
+            self.store.cleanup()
+        except Exception as e:
+            logger.error("Ошибка удаления истекших сессий: %s", e)
@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from summaries import resume_view, summarize, summary_changed
+
+# Файл базы снимков лимитов, которую заполняет сборщик (python get.py collect)
+SNAPSHOT_DB_PATH = os.getenv('SNAPSHOT_DB_PATH', 'data/limits.db')
+# Максимальный возраст снимка (секунды), при котором веб-интерфейс показывает его вместо запроса к HH.ru
+SNAPSHOT_MAX_AGE = int(os.getenv('SNAPSHOT_MAX_AGE', '1800'))
+# Сколько секунд браузер может показывать ответ по снимку без повторного запроса (Cache-Control: max-age)
+SNAPSHOT_CACHE_MAX_AGE = int(os.getenv('SNAPSHOT_CACHE_MAX_AGE', '60'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    employer_id TEXT NOT NULL,
+    taken_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_employer_taken ON snapshots (employer_id, taken_at);
+
+CREATE TABLE IF NOT EXISTS manager_limits (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id),
+    employer_id TEXT NOT NULL,
+    manager_id TEXT NOT NULL,
+    manager_name TEXT,
+    taken_at REAL NOT NULL,
+    resume_view_limit INTEGER,
+    resume_view_spend INTEGER,
+    resume_view_left INTEGER,
+    limits TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS manager_limits_snapshot ON manager_limits (snapshot_id);
+CREATE INDEX IF NOT EXISTS manager_limits_manager_taken ON manager_limits (employer_id, manager_id, taken_at);
+
+-- Последняя сводка по каждому менеджеру (summaries.summarize); обновляется
+-- только для менеджеров, значения которых изменились
+CREATE TABLE IF NOT EXISTS manager_summaries (
+    employer_id TEXT NOT NULL,
+    manager_id TEXT NOT NULL,
+    manager_name TEXT,
+    snapshot_id INTEGER NOT NULL,
+    changed_at REAL NOT NULL,
+    resume_view_limit INTEGER,
+    resume_view_spend INTEGER,
+    resume_view_left INTEGER,
+    percent_used REAL,
+    percent_left REAL,
+    resets_at REAL,
+    PRIMARY KEY (employer_id, manager_id)
+);
+"""
+
+
+_SUMMARY_COLUMNS = (
+    ('limit', 'resume_view_limit'),
+    ('spend', 'resume_view_spend'),
+    ('left', 'resume_view_left'),
+    ('percent_used', 'percent_used'),
+    ('percent_left', 'percent_left'),
+    ('resets_at', 'resets_at')
+)
+
+
+def _row_to_summary(row):
+    return {key: row[column] for key, column in _SUMMARY_COLUMNS}
+
+
+# Хранилище снимков лимитов в SQLite. Каждый снимок — результат одного
+# обхода всех менеджеров работодателя.
+class SnapshotStore:
+    def __init__(self, path=SNAPSHOT_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # Сохранение результатов fetcher.fetch_all_limits() как одного снимка
+    def save_snapshot(self, employer_id, results, taken_at=None):
+        snapshot_id, _ = self.record_snapshot(employer_id, results, taken_at)
+        return snapshot_id
+
+    # Сохранение снимка и обновление сводок менеджеров в одной транзакции.
+    # Возвращает (snapshot_id, changes): changes — менеджеры, у которых изменились
+    # лимиты, в виде {'manager_id', 'manager_name', 'previous', 'current'}
+    # (previous — прежняя сводка или None для нового менеджера).
+    def record_snapshot(self, employer_id, results, taken_at=None):
+        taken_at = taken_at or time.time()
+        employer_id = str(employer_id)
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            snapshot_id = conn.execute(
+                'INSERT INTO snapshots (employer_id, taken_at) VALUES (?, ?)', (employer_id, taken_at)
+            ).lastrowid
+            conn.executemany(
+                'INSERT INTO manager_limits (snapshot_id, employer_id, manager_id, manager_name, taken_at, '
+                'resume_view_limit, resume_view_spend, resume_view_left, limits, error) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (
+                        snapshot_id, employer_id, str(item['manager_id']), item['manager_name'], taken_at,
+                        resume_view(item['limits'], 'limits'),
+                        resume_view(item['limits'], 'spend'),
+                        resume_view(item['limits'], 'left'),
+                        json.dumps(item['limits'], ensure_ascii=False) if item['limits'] is not None else None,
+                        item['error']
+                    )
+                    for item in results
+                ]
+            )
+            changes = self._update_summaries(conn, employer_id, snapshot_id, results, taken_at)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return snapshot_id, changes
+
+    # Сводки пересчитываются только для полученных лимитов; менеджеры с ошибкой
+    # сохраняют прежнюю сводку. Строка обновляется, только если значения изменились
+    # (после сброса лимитов в начале месяца меняется и resets_at).
+    def _update_summaries(self, conn, employer_id, snapshot_id, results, taken_at):
+        previous = {
+            row['manager_id']: _row_to_summary(row)
+            for row in conn.execute('SELECT * FROM manager_summaries WHERE employer_id = ?', (employer_id,))
+        }
+        changes = []
+        rows = []
+        for item in results:
+            current = summarize(item['limits'], taken_at) if item['limits'] is not None else None
+            if current is None:
+                continue
+            manager_id = str(item['manager_id'])
+            before = previous.get(manager_id)
+            if not summary_changed(before, current):
+                continue
+            rows.append((employer_id, manager_id, item['manager_name'], snapshot_id, taken_at)
+                        + tuple(current[key] for key, _ in _SUMMARY_COLUMNS))
+            changes.append({'manager_id': manager_id, 'manager_name': item['manager_name'],
+                            'previous': before, 'current': current})
+        if rows:
+            conn.executemany(
+                'INSERT OR REPLACE INTO manager_summaries (employer_id, manager_id, manager_name, snapshot_id, '
+                'changed_at, resume_view_limit, resume_view_spend, resume_view_left, '
+                'percent_used, percent_left, resets_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+        return changes
+
+    # Сводки всех менеджеров работодателя: {manager_id: summary}
+    def summaries(self, employer_id):
+        rows = self._connect().execute(
+            'SELECT * FROM manager_summaries WHERE employer_id = ?', (str(employer_id),)
+        ).fetchall()
+        return {row['manager_id']: _row_to_summary(row) for row in rows}
+
+    @staticmethod
+    def _row_to_item(row):
+        return {
+            'manager_id': row['manager_id'],
+            'manager_name': row['manager_name'],
+            'limits': json.loads(row['limits']) if row['limits'] is not None else None,
+            'error': row['error'],
+            'taken_at': row['taken_at'],
+            'snapshot_id': row['snapshot_id']
+        }
+
+    # Идентификатор и время последнего снимка работодателя: (snapshot_id, taken_at)
+    # или (None, None). Запрос по индексу без чтения лимитов — для проверки ETag.
+    def latest_id(self, employer_id):
+        snapshot = self._connect().execute(
+            'SELECT id, taken_at FROM snapshots WHERE employer_id = ? ORDER BY taken_at DESC LIMIT 1',
+            (str(employer_id),)
+        ).fetchone()
+        if snapshot is None:
+            return None, None
+        return snapshot['id'], snapshot['taken_at']
+
+    # Менеджеры одного снимка
+    def items(self, snapshot_id):
+        rows = self._connect().execute(
+            'SELECT * FROM manager_limits WHERE snapshot_id = ? ORDER BY rowid', (snapshot_id,)
+        ).fetchall()
+        return [self._row_to_item(row) for row in rows]
+
+    # Последний снимок работодателя: (taken_at, список менеджеров) или (None, [])
+    def latest(self, employer_id):
+        snapshot_id, taken_at = self.latest_id(employer_id)
+        if snapshot_id is None:
+            return None, []
+        return taken_at, self.items(snapshot_id)
+
+    # Последние успешно полученные лимиты менеджера или None
+    def latest_for_manager(self, employer_id, manager_id):
+        row = self._connect().execute(
+            'SELECT * FROM manager_limits WHERE employer_id = ? AND manager_id = ? AND limits IS NOT NULL '
+            'ORDER BY taken_at DESC LIMIT 1',
+            (str(employer_id), str(manager_id))
+        ).fetchone()
+        return self._row_to_item(row) if row else None
+
+    # История resume_view по всем менеджерам работодателя начиная с since (UNIX time),
+    # отсортированная по менеджеру и времени
+    def history(self, employer_id, since=0):
+        return self._connect().execute(
+            'SELECT manager_id, manager_name, taken_at, resume_view_limit, resume_view_spend, resume_view_left '
+            'FROM manager_limits WHERE employer_id = ? AND taken_at >= ? AND resume_view_spend IS NOT NULL '
+            'ORDER BY manager_id, taken_at',
+            (str(employer_id), since)
+        ).fetchall()
+
+
+# Хранилище снимков для веб-интерфейса: открывается, только если сборщик уже создал базу
+def open_existing_store(path=SNAPSHOT_DB_PATH):
+    if not os.path.exists(path):
+        return None
+    return SnapshotStore(path)
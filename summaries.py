@@ -0,0 +1,55 @@
+import time
+from datetime import datetime, timezone
+
+# Производные поля лимитов менеджера (остаток, доля израсходованного, время сброса).
+# Считаются один раз при сохранении снимка и хранятся в snapshots.manager_summaries.
+
+
+# Конец текущего календарного месяца (UTC) в виде UNIX timestamp — момент сброса лимитов
+def period_end(now):
+    current = datetime.fromtimestamp(now, timezone.utc)
+    if current.month == 12:
+        end = datetime(current.year + 1, 1, 1, tzinfo=timezone.utc)
+    else:
+        end = datetime(current.year, current.month + 1, 1, tzinfo=timezone.utc)
+    return end.timestamp()
+
+
+# Числовое значение поля resume_view из раздела ответа /limits/resume
+def resume_view(limits, section):
+    if not isinstance(limits, dict):
+        return None
+    value = (limits.get(section) or {}).get('resume_view')
+    return value if isinstance(value, int) else None
+
+
+# Сводка по ответу /limits/resume: limit, spend, left, percent_used, percent_left
+# и resets_at (UNIX time). None, если в ответе нет лимита просмотров резюме.
+def summarize(limits, now=None):
+    now = now or time.time()
+    limit = resume_view(limits, 'limits')
+    spend = resume_view(limits, 'spend')
+    left = resume_view(limits, 'left')
+    if limit is None and spend is None and left is None:
+        return None
+    if left is None and limit is not None and spend is not None:
+        left = max(0, limit - spend)
+    if spend is None and limit is not None and left is not None:
+        spend = max(0, limit - left)
+    percent_used = round(spend * 100.0 / limit, 1) if limit and spend is not None else None
+    return {
+        'limit': limit,
+        'spend': spend,
+        'left': left,
+        'percent_used': percent_used,
+        'percent_left': round(100.0 - percent_used, 1) if percent_used is not None else None,
+        'resets_at': period_end(now)
+    }
+
+
+# Изменились ли значения лимитов менеджера или время сброса: после перехода
+# на новый месяц сводка обновляется, даже если значения лимитов те же
+def summary_changed(previous, current):
+    if previous is None:
+        return current is not None
+    return any(previous.get(key) != current.get(key) for key in ('limit', 'spend', 'left', 'resets_at'))
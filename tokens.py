@@ -0,0 +1,251 @@
+import os
+import json
+import stat
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from dotenv import dotenv_values
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: только блокировка внутри процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# За сколько секунд до истечения access_token обновлять его заранее
+TOKEN_REFRESH_MARGIN = int(os.getenv('TOKEN_REFRESH_MARGIN', '60'))
+# Каталог для межпроцессных блокировок и результатов обновления токенов
+TOKEN_LOCK_DIR = os.getenv('TOKEN_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'hh_limits_tokens'))
+# Сколько хранить результат обновления, чтобы его могли подхватить другие воркеры
+TOKEN_RESULT_TTL = int(os.getenv('TOKEN_RESULT_TTL', '300'))
+
+
+# Каталог блокировок принадлежит другому пользователю или не является каталогом
+class TokenLockDirError(Exception):
+    pass
+
+
+# Время истечения токена в виде UNIX timestamp.
+# Поддерживается старый формат строки '%Y-%m-%d %H:%M:%S' (UTC).
+def parse_expires_at(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+
+
+# Менеджер обновления токенов: обновляет access_token заранее и гарантирует,
+# что один refresh_token используется для обновления ровно один раз даже при
+# одновременных запросах из разных потоков и воркеров gunicorn.
+# Проигравшие получают результат обновления, выполненного победителем:
+# потоки того же процесса — из памяти, другие воркеры — из файла в TOKEN_LOCK_DIR.
+# В файле результата токены, поэтому он удаляется по истечении result_ttl.
+class TokenManager:
+    def __init__(self, refresh_func, lock_dir=TOKEN_LOCK_DIR, margin=TOKEN_REFRESH_MARGIN, result_ttl=TOKEN_RESULT_TTL):
+        self.refresh_func = refresh_func
+        self.lock_dir = lock_dir
+        self.margin = margin
+        self.result_ttl = result_ttl
+        self.refreshes = 0
+        self.reused = 0
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._results = {}
+
+    def needs_refresh(self, expires_at):
+        return expires_at is None or time.time() >= expires_at - self.margin
+
+    # Блокировка потоков по ключу; запись удаляется, когда ее никто не ждет
+    @contextmanager
+    def _thread_lock(self, key):
+        with self._locks_guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    # Каталог в общем /tmp используется, только если принадлежит текущему
+    # пользователю; права остальных пользователей снимаются
+    def _ensure_lock_dir(self):
+        os.makedirs(self.lock_dir, mode=0o700, exist_ok=True)
+        info = os.lstat(self.lock_dir)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+            raise TokenLockDirError(f'{self.lock_dir}: каталог блокировок токенов принадлежит другому пользователю')
+        if info.st_mode & 0o077:
+            os.chmod(self.lock_dir, 0o700)
+
+    @contextmanager
+    def _process_lock(self, key):
+        if fcntl is None:
+            yield
+            return
+        self._ensure_lock_dir()
+        with open(os.path.join(self.lock_dir, f'{key}.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _result_path(self, key):
+        return os.path.join(self.lock_dir, f'{key}.json')
+
+    def _fresh(self, result):
+        return time.time() - result.get('refreshed_at', 0) <= self.result_ttl
+
+    def _load_result(self, key):
+        result = self._results.get(key)
+        if result is not None and self._fresh(result):
+            return result
+        if fcntl is None:
+            return None
+        try:
+            with open(self._result_path(key), 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return result if self._fresh(result) else None
+
+    def _save_result(self, key, result):
+        self._results[key] = result
+        if fcntl is None:
+            return
+        path = self._result_path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.lock_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(result, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Не удалось сохранить результат обновления токена: %s", e)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    # Удаление устаревших результатов: из памяти и файлов результатов и блокировок
+    # (устаревший ключ не используется повторно — refresh_token одноразовый)
+    def _purge_results(self):
+        deadline = time.time() - self.result_ttl
+        for key, result in list(self._results.items()):
+            if result.get('refreshed_at', 0) < deadline:
+                self._results.pop(key, None)
+        if fcntl is None:
+            return
+        try:
+            names = os.listdir(self.lock_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(('.json', '.lock')):
+                continue
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.stat(path).st_mtime < deadline:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    # Обновление токена. Возвращает dict с access_token, refresh_token и expires_at (timestamp)
+    def refresh(self, refresh_token):
+        key = hashlib.sha256(refresh_token.encode('utf-8')).hexdigest()[:32]
+        with self._thread_lock(key):
+            with self._process_lock(key):
+                result = self._load_result(key)
+                if result is not None:
+                    self.reused += 1
+                    metrics.TOKEN_REFRESHES.inc(result='reused')
+                    return result
+
+                try:
+                    token_info = self.refresh_func(refresh_token)
+                except Exception:
+                    metrics.TOKEN_REFRESHES.inc(result='error')
+                    raise
+                result = {
+                    'access_token': token_info['access_token'],
+                    'refresh_token': token_info.get('refresh_token', refresh_token),
+                    'expires_at': time.time() + token_info.get('expires_in', 3600),
+                    'refreshed_at': time.time()
+                }
+                self.refreshes += 1
+                metrics.TOKEN_REFRESHES.inc(result='refreshed')
+                self._save_result(key, result)
+        self._purge_results()
+        # Файл с этим результатом удаляется после result_ttl, даже если новых обновлений не будет
+        timer = threading.Timer(self.result_ttl + 1, self._purge_results)
+        timer.daemon = True
+        timer.start()
+        return result
+
+
+# Токены get.py в файле .env. Чтение и запись выполняются под межпроцессной
+# блокировкой (отдельный файл .env.lock: при переименовании .env меняется inode),
+# файл перезаписывается атомарно — через временный файл и os.replace, поэтому
+# одновременные запуски и сбой во время записи не оставляют .env обрезанным.
+class EnvTokenFile:
+    def __init__(self, path='.env'):
+        self.path = path
+
+    @contextmanager
+    def locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(f'{self.path}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Текущие значения переменных из файла (а не из окружения процесса,
+    # которое могло устареть, если другой запуск уже обновил токен)
+    def read(self):
+        if not os.path.exists(self.path):
+            return {}
+        return {key: value for key, value in dotenv_values(self.path).items() if value is not None}
+
+    # Замена переменных с сохранением остальных строк файла и его прав доступа.
+    # Вызывается внутри locked().
+    def update(self, new_vars):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+            mode = os.stat(self.path).st_mode & 0o777
+        except FileNotFoundError:
+            lines, mode = [], 0o600
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.env.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for line in lines:
+                    if line.strip().split('=')[0] in new_vars:
+                        continue  # Пропускаем переменные, которые будем обновлять
+                    f.write(line if line.endswith('\n') else line + '\n')
+                for key, value in new_vars.items():
+                    f.write(f'{key}={value}\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise